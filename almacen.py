@@ -0,0 +1,217 @@
+"""
+Almacén local de pedidos (SQLite).
+
+Guarda los pedidos normalizados, con las etiquetas de `owner_note` separadas en
+columnas propias, y resuelve cada pestaña con un índice parcial y limit/offset.
+Los datos sobreviven a reinicios: el cursor de sincronización también vive acá.
+
+Un pedido se guarda y se lee como `Pedido`: sólo los campos que usa la app, no el
+JSON completo de Tiendanube (direcciones, envío, pago, productos enteros...).
+
+También recuerda a qué cliente de ARIA se resolvió cada pedido (y con qué
+método), junto con una huella de los datos que usó la cascada: mientras el
+nombre, el documento y la nota no cambien, no hace falta volver a buscarlo.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+
+from metricas import METRICAS
+
+# ETIQUETAS
+TAG_PENDIENTE = "#PENDIENTE_PAGO"
+TAG_APROBADO = "#APROBADO"
+
+# Condición de cada pestaña. Cada una tiene su índice parcial con el mismo WHERE,
+# así que la consulta de una página no depende de cuántos pedidos haya en total.
+BANDEJAS = {
+    "nuevos": "status = 'open' AND payment_status = 'pending' AND tag_pendiente = 0 AND tag_aprobado = 0",
+    "pendientes": "status = 'open' AND payment_status = 'pending' AND tag_pendiente = 1",
+    "aprobados": "status != 'cancelled' AND (payment_status = 'paid' OR tag_aprobado = 1)",
+    "cancelados": "status = 'cancelled'",
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pedidos (
+    id INTEGER PRIMARY KEY,
+    numero INTEGER,
+    status TEXT,
+    payment_status TEXT,
+    owner_note TEXT,
+    tag_pendiente INTEGER NOT NULL DEFAULT 0,
+    tag_aprobado INTEGER NOT NULL DEFAULT 0,
+    total REAL,
+    cliente_nombre TEXT,
+    cliente_email TEXT,
+    cliente_ident TEXT,
+    updated_at TEXT,
+    datos TEXT NOT NULL  -- productos: [[nombre, cantidad], ...]
+);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS resoluciones (
+    pedido_id INTEGER PRIMARY KEY,
+    huella TEXT NOT NULL,
+    cliente_id TEXT NOT NULL,
+    metodo TEXT NOT NULL,
+    mensaje TEXT NOT NULL,
+    resuelto_en TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# La bandeja de cada pedido como columna calculada (la usan los rollups de analitica.py);
+# donde las condiciones se pisan, gana la primera
+BANDEJA_SQL = "CASE " + " ".join(f"WHEN {BANDEJAS[n]} THEN '{n}'" for n in ("cancelados", "aprobados", "pendientes", "nuevos")) + " END"
+
+COLUMNAS = ("id", "numero", "status", "payment_status", "owner_note", "tag_pendiente", "tag_aprobado", "total",
+            "cliente_nombre", "cliente_email", "cliente_ident", "updated_at", "datos")
+
+SQL_GUARDAR = (
+    f"INSERT INTO pedidos ({', '.join(COLUMNAS)}) VALUES ({', '.join('?' * len(COLUMNAS))}) "
+    f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNAS[1:])} "
+    "WHERE excluded.updated_at IS NULL OR pedidos.updated_at IS NULL OR excluded.updated_at >= pedidos.updated_at"
+)
+
+
+def huella_cliente(nombre, identificacion, nota):
+    """
+    Huella de los datos con los que la cascada busca al cliente de un pedido.
+    Nuestras etiquetas no cuentan: marcar un pedido como pendiente o aprobado no invalida lo resuelto.
+    """
+    nota = str(nota or "")
+    for tag in (TAG_PENDIENTE, TAG_APROBADO): nota = nota.replace(tag, "")
+    datos = json.dumps([" ".join(str(nombre or "").lower().split()), str(identificacion or "").strip(), " ".join(nota.split())])
+    return hashlib.sha1(datos.encode()).hexdigest()
+
+
+class Pedido:
+    """
+    Lo que la app usa de un pedido de Tiendanube, y nada más. Las etiquetas ya vienen separadas
+    de la nota y el resumen de productos ya armado: pintar un panel no recorre ningún JSON.
+    """
+
+    __slots__ = ("id", "numero", "status", "payment_status", "owner_note", "total", "cliente_nombre", "cliente_email",
+                 "cliente_ident", "updated_at", "productos", "tag_pendiente", "tag_aprobado", "resumen_productos")
+
+    def __init__(self, id, numero=None, status=None, payment_status=None, owner_note="", total=0.0, cliente_nombre=None,
+                 cliente_email=None, cliente_ident=None, updated_at=None, productos=()):
+        self.id = id
+        self.numero = numero
+        self.status = status
+        self.payment_status = payment_status
+        self.owner_note = owner_note or ""
+        self.total = total
+        self.cliente_nombre = cliente_nombre
+        self.cliente_email = cliente_email
+        self.cliente_ident = cliente_ident
+        self.updated_at = updated_at
+        self.productos = tuple(productos)  # ((nombre, cantidad), ...)
+        self.tag_pendiente = TAG_PENDIENTE in self.owner_note
+        self.tag_aprobado = TAG_APROBADO in self.owner_note
+        self.resumen_productos = ", ".join(f"{nombre} ({cantidad})" for nombre, cantidad in self.productos)
+
+    @classmethod
+    def desde_tn(cls, p):
+        """Proyecta el JSON de un pedido de Tiendanube."""
+        cliente = p.get('customer') or {}
+        try: total = float(p.get('total') or 0)
+        except (TypeError, ValueError): total = 0.0
+        return cls(p['id'], p.get('number'), p.get('status'), p.get('payment_status'), p.get('owner_note'), total,
+                   cliente.get('name'), cliente.get('email'), cliente.get('identification'), p.get('updated_at'),
+                   ((i.get('name'), i.get('quantity')) for i in p.get('products') or []))
+
+    @classmethod
+    def desde_fila(cls, fila):
+        *campos, tag_pendiente, tag_aprobado, total, nombre, email, ident, actualizado, datos = fila
+        productos = json.loads(datos)
+        # Filas guardadas antes de la proyección: tienen el JSON completo de Tiendanube
+        if isinstance(productos, dict): productos = [(i.get('name'), i.get('quantity')) for i in productos.get('products') or []]
+        return cls(*campos, total, nombre, email, ident, actualizado, map(tuple, productos))
+
+    def fila(self):
+        """La fila que guardamos, en el orden de COLUMNAS."""
+        return (self.id, self.numero, self.status, self.payment_status, self.owner_note, int(self.tag_pendiente),
+                int(self.tag_aprobado), self.total, self.cliente_nombre, self.cliente_email, self.cliente_ident,
+                self.updated_at, json.dumps(self.productos, ensure_ascii=False))
+
+    @property
+    def id_visual(self):
+        return self.numero if self.numero is not None else self.id
+
+    @property
+    def nombres_productos(self):
+        return [nombre for nombre, _ in self.productos if nombre]
+
+    def __repr__(self):
+        return f"Pedido({self.id}, #{self.numero}, {self.status}/{self.payment_status}, {self.cliente_nombre!r})"
+
+
+class AlmacenPedidos:
+    def __init__(self, ruta="pedidos.sqlite3"):
+        self.con = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.con:
+            self.con.execute("PRAGMA journal_mode=WAL")
+            self.con.executescript(ESQUEMA)
+            if "bandeja" not in {c[1] for c in self.con.execute("PRAGMA table_xinfo(pedidos)")}:
+                self.con.execute(f"ALTER TABLE pedidos ADD COLUMN bandeja TEXT GENERATED ALWAYS AS ({BANDEJA_SQL}) VIRTUAL")
+            for nombre, condicion in BANDEJAS.items():
+                self.con.execute(f"CREATE INDEX IF NOT EXISTS ix_bandeja_{nombre} ON pedidos(id DESC) WHERE {condicion}")
+
+    def guardar(self, pedidos):
+        """
+        Inserta o actualiza pedidos (`Pedido`). Una versión más vieja que la guardada (por updated_at) se ignora,
+        así un webhook que llega tarde no pisa lo que ya trajo la sincronización.
+        """
+        filas = [p.fila() for p in pedidos]
+        if not filas: return 0
+        with self._lock, self.con:
+            self.con.executemany(SQL_GUARDAR, filas)
+        return len(filas)
+
+    def bandeja(self, nombre, limite=None, desde=0):
+        """Pedidos de una pestaña, del más nuevo al más viejo."""
+        sql = f"SELECT {', '.join(COLUMNAS)} FROM pedidos WHERE {BANDEJAS[nombre]} ORDER BY id DESC LIMIT ? OFFSET ?"
+        with METRICAS.medir("etapa", etapa="bandeja", bandeja=nombre):
+            with self._lock:
+                filas = self.con.execute(sql, (-1 if limite is None else limite, desde)).fetchall()
+            return [Pedido.desde_fila(f) for f in filas]
+
+    def contar(self, nombre):
+        with self._lock:
+            return self.con.execute(f"SELECT COUNT(*) FROM pedidos WHERE {BANDEJAS[nombre]}").fetchone()[0]
+
+    def resoluciones(self, solicitudes):
+        """
+        {pedido_id: (nombre, documento, nota)} -> {pedido_id: (cliente_id, mensaje)}, sólo de los pedidos
+        cuya resolución guardada se hizo con estos mismos datos.
+        """
+        ids = list(solicitudes)
+        filas = []
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                lote = ids[i:i + 500]
+                filas += self.con.execute(f"SELECT pedido_id, huella, cliente_id, mensaje FROM resoluciones "
+                                          f"WHERE pedido_id IN ({', '.join('?' * len(lote))})", lote).fetchall()
+        return {pid: (cliente_id, mensaje) for pid, huella, cliente_id, mensaje in filas if huella == huella_cliente(*solicitudes[pid])}
+
+    def guardar_resolucion(self, pedido_id, huella, cliente_id, metodo, mensaje):
+        with self._lock, self.con:
+            self.con.execute("INSERT OR REPLACE INTO resoluciones (pedido_id, huella, cliente_id, metodo, mensaje) VALUES (?, ?, ?, ?, ?)",
+                             (pedido_id, huella, str(cliente_id), metodo, mensaje))
+
+    def olvidar_resolucion(self, pedido_id):
+        with self._lock, self.con:
+            self.con.execute("DELETE FROM resoluciones WHERE pedido_id = ?", (pedido_id,))
+
+    def leer_meta(self, clave, defecto=None):
+        with self._lock:
+            fila = self.con.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+
+    def guardar_meta(self, clave, valor):
+        with self._lock, self.con:
+            self.con.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (clave, valor))
@@ -0,0 +1,158 @@
+"""
+Rollups diarios para la pestaña de analítica.
+
+Tres agregados por día que mantiene SQLite con triggers, a medida que llegan los
+cambios; leerlos nunca recorre el historial:
+
+- rollup_bandejas: pedidos (y monto) que entraron a cada bandeja ese día (por su
+  updated_at). Sale de los upserts del almacén, vía la columna calculada `bandeja`.
+- rollup_analisis: resultados de la cascada por método y decisión, con la suma de
+  totales y de cupos (diferencia promedio, uso del cupo). Se alimenta de `analisis`,
+  una fila por pedido: volver a analizar un pedido mueve su aporte, no lo duplica.
+- rollup_notificaciones: mails encolados por escenario y perfil de cross-selling,
+  una vez por clave de la bandeja de salida.
+
+Usa el mismo archivo SQLite que el almacén, con su propia conexión (como la bandeja
+de salida), y se crea después de él: los triggers cuelgan de la tabla de pedidos.
+"""
+import sqlite3
+import threading
+
+SIN_PERFIL = ""
+
+_SUMAR_BANDEJA = """
+    INSERT INTO rollup_bandejas VALUES (coalesce(substr(NEW.updated_at, 1, 10), date('now', 'localtime')), NEW.bandeja, 1, NEW.total)
+    ON CONFLICT(dia, bandeja) DO UPDATE SET pedidos = pedidos + 1, monto = monto + excluded.monto;
+"""
+
+_SUMAR_ANALISIS = """
+    INSERT INTO rollup_analisis VALUES (NEW.dia, NEW.metodo, NEW.decision, 1, NEW.total, NEW.cupo)
+    ON CONFLICT(dia, metodo, decision) DO UPDATE SET pedidos = pedidos + 1, suma_total = suma_total + excluded.suma_total,
+        suma_cupo = suma_cupo + excluded.suma_cupo;
+"""
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS rollup_bandejas (
+    dia TEXT NOT NULL,
+    bandeja TEXT NOT NULL,
+    pedidos INTEGER NOT NULL,
+    monto REAL NOT NULL,
+    PRIMARY KEY (dia, bandeja)
+);
+CREATE TRIGGER IF NOT EXISTS rollup_bandejas_alta AFTER INSERT ON pedidos WHEN NEW.bandeja IS NOT NULL
+BEGIN {_SUMAR_BANDEJA} END;
+CREATE TRIGGER IF NOT EXISTS rollup_bandejas_cambio AFTER UPDATE ON pedidos
+WHEN NEW.bandeja IS NOT NULL AND NEW.bandeja IS NOT OLD.bandeja
+BEGIN {_SUMAR_BANDEJA} END;
+
+CREATE TABLE IF NOT EXISTS analisis (
+    pedido_id INTEGER PRIMARY KEY,
+    dia TEXT NOT NULL,
+    metodo TEXT NOT NULL,
+    decision TEXT NOT NULL,
+    total REAL NOT NULL,
+    cupo REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_analisis (
+    dia TEXT NOT NULL,
+    metodo TEXT NOT NULL,
+    decision TEXT NOT NULL,
+    pedidos INTEGER NOT NULL,
+    suma_total REAL NOT NULL,
+    suma_cupo REAL NOT NULL,
+    PRIMARY KEY (dia, metodo, decision)
+);
+CREATE TRIGGER IF NOT EXISTS rollup_analisis_alta AFTER INSERT ON analisis
+BEGIN {_SUMAR_ANALISIS} END;
+CREATE TRIGGER IF NOT EXISTS rollup_analisis_cambio AFTER UPDATE ON analisis
+BEGIN
+    UPDATE rollup_analisis SET pedidos = pedidos - 1, suma_total = suma_total - OLD.total, suma_cupo = suma_cupo - OLD.cupo
+    WHERE dia = OLD.dia AND metodo = OLD.metodo AND decision = OLD.decision;
+    DELETE FROM rollup_analisis WHERE dia = OLD.dia AND metodo = OLD.metodo AND decision = OLD.decision AND pedidos <= 0;
+    {_SUMAR_ANALISIS}
+END;
+
+CREATE TABLE IF NOT EXISTS notificaciones (
+    clave TEXT PRIMARY KEY,
+    dia TEXT NOT NULL,
+    escenario INTEGER NOT NULL,
+    perfil TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_notificaciones (
+    dia TEXT NOT NULL,
+    escenario INTEGER NOT NULL,
+    perfil TEXT NOT NULL,
+    mails INTEGER NOT NULL,
+    PRIMARY KEY (dia, escenario, perfil)
+);
+CREATE TRIGGER IF NOT EXISTS rollup_notificaciones_alta AFTER INSERT ON notificaciones
+BEGIN
+    INSERT INTO rollup_notificaciones VALUES (NEW.dia, NEW.escenario, NEW.perfil, 1)
+    ON CONFLICT(dia, escenario, perfil) DO UPDATE SET mails = mails + 1;
+END;
+"""
+
+# Un almacén que ya tenía pedidos antes de los triggers arranca con la foto de hoy
+# (cada pedido en su bandeja actual, el día de su updated_at), una sola vez.
+SQL_FOTO_INICIAL = """
+INSERT INTO rollup_bandejas
+SELECT coalesce(substr(updated_at, 1, 10), date('now', 'localtime')), bandeja, COUNT(*), SUM(total) FROM pedidos
+WHERE bandeja IS NOT NULL AND NOT EXISTS (SELECT 1 FROM meta WHERE clave = 'rollups_desde')
+GROUP BY 1, 2;
+INSERT OR IGNORE INTO meta VALUES ('rollups_desde', date('now', 'localtime'));
+"""
+
+
+class Analitica:
+    def __init__(self, ruta="pedidos.sqlite3"):
+        self.con = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # Triggers y foto inicial en la misma transacción: ningún upsert queda contado dos veces (ni cero)
+            self.con.executescript(f"BEGIN IMMEDIATE; {ESQUEMA} {SQL_FOTO_INICIAL} COMMIT;")
+
+    def registrar_analisis(self, pedido_id, metodo, decision, total, cupo):
+        """Resultado de la cascada para un pedido. Si ya estaba igual no cambia nada; si cambió, se mueve a hoy."""
+        with self._lock, self.con:
+            self.con.execute(
+                """INSERT INTO analisis VALUES (?, date('now', 'localtime'), ?, ?, ?, ?)
+                   ON CONFLICT(pedido_id) DO UPDATE SET dia = excluded.dia, metodo = excluded.metodo,
+                       decision = excluded.decision, total = excluded.total, cupo = excluded.cupo
+                   WHERE (metodo, decision, total, cupo) IS NOT (excluded.metodo, excluded.decision, excluded.total, excluded.cupo)""",
+                (pedido_id, metodo, decision, total, cupo),
+            )
+
+    def registrar_notificacion(self, clave, escenario, perfil=SIN_PERFIL):
+        """Un mail encolado; la misma clave (pedido + escenario) cuenta una sola vez."""
+        with self._lock, self.con:
+            self.con.execute("INSERT OR IGNORE INTO notificaciones VALUES (?, date('now', 'localtime'), ?, ?)",
+                             (clave, escenario, perfil or SIN_PERFIL))
+
+    def _filas(self, sql, *params):
+        with self._lock:
+            cursor = self.con.execute(sql, params)
+            columnas = [c[0] for c in cursor.description]
+            return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+    def bandejas_por_dia(self, desde):
+        """[{dia, nuevos, pendientes, aprobados, cancelados, monto_aprobado}] desde una fecha 'AAAA-MM-DD'."""
+        return self._filas(
+            """SELECT dia,
+                      SUM(CASE WHEN bandeja = 'nuevos' THEN pedidos ELSE 0 END) AS nuevos,
+                      SUM(CASE WHEN bandeja = 'pendientes' THEN pedidos ELSE 0 END) AS pendientes,
+                      SUM(CASE WHEN bandeja = 'aprobados' THEN pedidos ELSE 0 END) AS aprobados,
+                      SUM(CASE WHEN bandeja = 'cancelados' THEN pedidos ELSE 0 END) AS cancelados,
+                      SUM(CASE WHEN bandeja = 'aprobados' THEN monto ELSE 0 END) AS monto_aprobado
+               FROM rollup_bandejas WHERE dia >= ? GROUP BY dia ORDER BY dia""", desde)
+
+    def analisis(self, desde):
+        """[{metodo, decision, pedidos, suma_total, suma_cupo}] del período."""
+        return self._filas(
+            """SELECT metodo, decision, SUM(pedidos) AS pedidos, SUM(suma_total) AS suma_total, SUM(suma_cupo) AS suma_cupo
+               FROM rollup_analisis WHERE dia >= ? GROUP BY metodo, decision ORDER BY pedidos DESC""", desde)
+
+    def notificaciones(self, desde):
+        """[{escenario, perfil, mails}] del período."""
+        return self._filas(
+            """SELECT escenario, perfil, SUM(mails) AS mails FROM rollup_notificaciones
+               WHERE dia >= ? GROUP BY escenario, perfil ORDER BY mails DESC""", desde)
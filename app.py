@@ -1,11 +1,11 @@
+import datetime
+import functools
+
 import streamlit as st
-import requests
-import re
-import smtplib
-import time
-import urllib.parse
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+
+from almacen import TAG_PENDIENTE, TAG_APROBADO
+from metricas import METRICAS
+from motor import APROBABLE, DIFERENCIA, MAIL_DUPLICADO, MORA, SIN_CLIENTE, CuposEnCurso, Motor, datos_cliente, evaluar_credito
 
 # ==========================================
 # ⚙️ 1. CONFIGURACIÓN Y SECRETOS
@@ -18,486 +18,434 @@ except Exception as e:
     st.error(f"⚠️ Error de Configuración: Faltan claves en Secrets ({e})")
     st.stop()
 
-# Configuración fija
-TN_USER_AGENT = "RobotWeb (24705)"
-ARIA_URL_BASE = "https://api.anatod.ar/api"
-
-# ETIQUETAS
-TAG_PENDIENTE = "#PENDIENTE_PAGO"
-TAG_APROBADO = "#APROBADO"
+WEBHOOKS_ACTIVOS = bool(st.secrets.get("WEBHOOKS_ACTIVOS", False))  # webhooks.py mantiene el almacén al día
+TAMANIOS_PAGINA = (10, 25, 50, 100)
+PERIODOS_ANALITICA = (7, 30, 90, 365)
+ESCENARIOS_ANALITICA = {1: "Rechazo (mora)", 2: "Diferencia", 3: "Aprobado"}
 
 if 'analisis_activo' not in st.session_state:
     st.session_state['analisis_activo'] = {}
+if 'analisis_resultados' not in st.session_state:
+    st.session_state['analisis_resultados'] = {}
 
 # ==========================================
-# 🧠 CEREBRO DE CROSS-SELLING (TUS REGLAS)
+# 🔌 2. MOTOR (sin Streamlit, ver motor.py)
 # ==========================================
-# ⚠️ IMPORTANTE: PARA QUE LAS FOTOS NO SE ROMPAN, AGREGA EL CAMPO "foto" CON EL LINK DE LA IMAGEN
-# Si no ponés foto, el robot intentará buscarla, pero puede fallar.
-
-PERFILES_INTERES = {
-    "GAMING": {
-        "keywords": ["gamer", "juego", "playstation", "ps4", "ps5", "joystick", "rtx", "teclado", "mecanico", "redragon", "pc", "mouse"],
-        "items": [
-            {"link": "https://ssstore.com.ar/productos/mouse-cerberus-redragon-m703/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/auricular-vincha-cronus-redragon-h211w-rgb/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/teclado-aditya-redragon-k513-rgb-sin-n/", "foto": ""}
-        ]
-    },
-    "CONECTIVIDAD": {
-        "keywords": ["starlink", "router", "antena", "wifi", "ubiquiti", "internet", "mesh", "cable", "red"],
-        "items": [
-            {"link": "https://ssstore.com.ar/productos/router-wifi-huaweii-ax2s-ws700v2/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/cable-starlink-mini-usb-c-a-fuente-portatil-usa-tu-antena-con-power-bank-n9thq/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/router-mesh-tp-link-deco-xe75-wifi-6e-ax5400-blanco-negro-1u/", "foto": ""}
-        ]
-    },
-    "MOVILIDAD": {
-        "keywords": ["samsung", "iphone", "motorola", "celular", "xiaomi", "smartphone", "apple", "android"],
-        "items": [
-            {"link": "https://ssstore.com.ar/productos/cable-foxbox-pixel-100w-con-display-lcd-usb-c-a-usb-c-egdem/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/cargador-de-auto-foxbox-way-qc-3-0-30w-carga-rapida-qualcomm-rfgoa/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/cargador-foxbox-mega-30w-gan-negro-para-iphone-cable-lightning-j8nie/", "foto": ""}
-        ]
-    },
-    "HOGAR": {
-        "keywords": ["tv", "smart", "televisor", "google", "android tv", "4k", "led", "ups", "casa"],
-        "items": [
-            {"link": "https://ssstore.com.ar/productos/auriculares-inalambricos-foxbox-clarity-negro-control-tactil-y-asistente-de-voz-qi0kh/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/ups-marsriva-kp2-ultra-16000mah-5v-12v-bivolt/", "foto": ""},
-            {"link": "https://ssstore.com.ar/productos/freidora-de-aire-foxbox-aeris-6l-digital-1500w-sin-aceite-yufou/", "foto": ""}
-        ]
-    }
-}
+@st.cache_resource
+def obtener_motor():
+    # Uno por proceso: todas las sesiones comparten pools, caches, almacén e hilos de fondo.
+    # Cada recurso se arma recién cuando se usa por primera vez.
+    return Motor(dict(st.secrets))
 
-# ==========================================
-# 🔌 2. FUNCIONES DE CONEXIÓN (API)
-# ==========================================
-def solo_numeros(texto):
-    if texto is None: return ""
-    return re.sub(r'\D', '', str(texto))
+def obtener_cliente_aria():
+    return obtener_motor().cliente_aria
 
 def consultar_api_aria_id(cliente_id):
-    headers = {"x-api-key": ARIA_KEY, "Content-Type": "application/json"}
-    try:
-        res = requests.get(f"{ARIA_URL_BASE}/cliente/{cliente_id}", headers=headers, timeout=5)
-        if res.status_code == 200:
-            d = res.json()
-            if isinstance(d, list): return d
-            if isinstance(d, dict): return [d]
-        return []
-    except: return []
-
-def consultar_api_aria(params):
-    headers = {"x-api-key": ARIA_KEY, "Content-Type": "application/json"}
-    try:
-        res = requests.get(f"{ARIA_URL_BASE}/clientes", headers=headers, params=params, timeout=8)
-        if res.status_code == 200:
-            d = res.json()
-            if isinstance(d, dict) and "data" in d: return d["data"]
-            if isinstance(d, list): return d
-            if isinstance(d, dict): return [d]
-        return []
-    except: return []
-
-def obtener_pedidos(estado="open"):
-    url = f"https://api.tiendanube.com/v1/{TN_ID}/orders?status={estado}&per_page=100"
-    headers = {'Authentication': f'bearer {TN_TOKEN}', 'User-Agent': TN_USER_AGENT}
-    try:
-        res = requests.get(url, headers=headers)
-        return res.json() if res.status_code == 200 else []
-    except Exception as e:
-        st.error(f"Error al traer pedidos: {e}")
-        return []
-
-# --- FUNCIONES INTELIGENTES PARA CROSS SELLING ---
-
-@st.cache_data(ttl=3600)
-def obtener_info_desde_item(item_dict):
-    """
-    Toma un diccionario {link, foto} y completa el precio y nombre desde TN.
-    Si tiene foto manual, usa esa. Si no, la busca.
-    """
-    link_producto = item_dict.get('link', '#')
-    foto_manual = item_dict.get('foto', '')
-    
-    # Valores por defecto
-    resultado = {
-        'nombre': "Producto Recomendado",
-        'precio': 0,
-        'foto': foto_manual if foto_manual else "https://via.placeholder.com/150?text=Ver+Web", # Placeholder simple
-        'url': link_producto
-    }
-
-    try:
-        # Extraer el 'handle' del link
-        slug = link_producto.strip("/").split("/")[-1]
-        nombre_busqueda = slug.replace("-", " ") 
-        
-        # Buscar en API TN para sacar precio y nombre real
-        url = f"https://api.tiendanube.com/v1/{TN_ID}/products"
-        params = {'q': nombre_busqueda, 'per_page': 1}
-        headers = {'Authentication': f'bearer {TN_TOKEN}', 'User-Agent': TN_USER_AGENT}
-        
-        res = requests.get(url, headers=headers, params=params)
-        if res.status_code == 200 and len(res.json()) > 0:
-            p = res.json()[0]
-            
-            # Usamos foto de la API solo si no hay foto manual
-            img_api = ""
-            if p.get('images'): img_api = p['images'][0]['src']
-            
-            resultado['nombre'] = p['name']['es']
-            resultado['precio'] = float(p.get('price', 0)) if p.get('price') else 0
-            if not foto_manual:
-                resultado['foto'] = img_api
-
-    except Exception as e:
-        print(f"Error buscando producto: {e}")
-    
-    return resultado
+    return obtener_cliente_aria().consultar_id(cliente_id)
+
+def obtener_almacen():
+    return obtener_motor().almacen
+
+def sincronizar_pedidos():
+    try: obtener_motor().sincronizar()
+    except Exception as e: st.error(f"Error al traer pedidos: {e}")
+
+def obtener_catalogo():
+    return obtener_motor().catalogo
 
 def generar_recomendaciones(nombre_producto_comprado):
-    nombre_lower = str(nombre_producto_comprado).lower()
-    perfil_detectado = "HOGAR" # Default
-    
-    # 1. Detección de Perfil
-    for perfil, datos in PERFILES_INTERES.items():
-        for kw in datos['keywords']:
-            if kw in nombre_lower:
-                perfil_detectado = perfil
-                break
-        if perfil_detectado != "HOGAR": break
-    
-    # 2. Obtener Items del perfil
-    items_objetivo = PERFILES_INTERES[perfil_detectado]['items']
-    
-    # 3. Enriquecer info
-    productos_finales = []
-    for item in items_objetivo:
-        info = obtener_info_desde_item(item)
-        if info: productos_finales.append(info)
-        
-    return productos_finales, perfil_detectado
+    # Perfil del pedido (acepta un nombre o la lista de productos) e items ya enriquecidos por el catálogo
+    return obtener_motor().recomendaciones(nombre_producto_comprado)
 
 # --- FUNCIONES DE ACCIÓN ---
 
-def aprobar_orden_completa(id_pedido, nota_actual, etiqueta_poner, etiqueta_sacar=None):
-    url = f"https://api.tiendanube.com/v1/{TN_ID}/orders/{id_pedido}"
-    headers = {'Authentication': f'bearer {TN_TOKEN}', 'User-Agent': TN_USER_AGENT, 'Content-Type': 'application/json'}
-    
-    nota_str = str(nota_actual) if nota_actual is not None else ""
-    if etiqueta_sacar: nota_str = nota_str.replace(etiqueta_sacar, "")
-    if etiqueta_poner and etiqueta_poner not in nota_str: nota_str = f"{nota_str} {etiqueta_poner}"
-    nota_final = nota_str.strip()
-    
-    payload = {"payment_status": "paid", "owner_note": nota_final}
-    
-    try:
-        res = requests.put(url, headers=headers, json=payload)
-        if res.status_code == 200: return True
-        else:
-            if res.status_code == 422: 
-                requests.put(url, headers=headers, json={"owner_note": nota_final})
-                return True 
-            st.error(f"❌ Error Tiendanube: {res.status_code} - {res.text}")
-            return False
-    except Exception as e:
-        st.error(f"❌ Error de conexión: {e}")
-        return False
+def obtener_escritor():
+    return obtener_motor().escritor
+
+# Reciben el `Pedido` del almacén (con su estado de pago y su nota): así un segundo click no repite el PUT.
+# El escritor guarda lo que responde Tiendanube, y el rerun ya muestra el pedido en su bandeja nueva.
+def aprobar_orden_completa(pedido, etiqueta_poner, etiqueta_sacar=None):
+    ok, detalle = obtener_escritor().aprobar(pedido, etiqueta_poner, etiqueta_sacar)
+    if not ok: st.error(f"❌ {detalle}")
+    return ok
 
-def actualizar_etiqueta(id_pedido, nota_actual, etiqueta_poner, etiqueta_sacar=None):
-    url = f"https://api.tiendanube.com/v1/{TN_ID}/orders/{id_pedido}"
-    headers = {'Authentication': f'bearer {TN_TOKEN}', 'User-Agent': TN_USER_AGENT, 'Content-Type': 'application/json'}
-    nota_str = str(nota_actual) if nota_actual is not None else ""
-    if etiqueta_sacar: nota_str = nota_str.replace(etiqueta_sacar, "")
-    if etiqueta_poner and etiqueta_poner not in nota_str: nota_str = f"{nota_str} {etiqueta_poner}"
-    res = requests.put(url, headers=headers, json={"owner_note": nota_str.strip()})
-    if res.status_code != 200: return False
-    return True
-
-def cancelar_orden_tn(id_pedido):
-    url = f"https://api.tiendanube.com/v1/{TN_ID}/orders/{id_pedido}/cancel"
-    headers = {'Authentication': f'bearer {TN_TOKEN}', 'User-Agent': TN_USER_AGENT, 'Content-Type': 'application/json'}
-    res = requests.post(url, headers=headers, json={"reason": "other"})
-    return res.status_code == 200
+def actualizar_etiqueta(pedido, etiqueta_poner, etiqueta_sacar=None):
+    ok, _ = obtener_escritor().etiquetar(pedido, etiqueta_poner, etiqueta_sacar)
+    return ok
+
+def cancelar_orden_tn(pedido):
+    ok, _ = obtener_escritor().cancelar(pedido)
+    return ok
 
 # ==========================================
 # 📧 3. GESTOR DE CORREOS
 # ==========================================
+def obtener_bandeja_salida():
+    return obtener_motor().bandeja_salida()
+
 def enviar_notificacion(email_cliente, nombre_cliente, escenario, datos_extra={}):
-    try:
-        SMTP_SERVER = st.secrets["email"]["smtp_server"]
-        SMTP_PORT = st.secrets["email"]["smtp_port"]
-        SMTP_USER = st.secrets["email"]["smtp_user"]
-        SMTP_PASS = st.secrets["email"]["smtp_password"]
-    except:
+    """Arma el mail y lo deja en la bandeja de salida; el envío real lo hace el hilo de la bandeja."""
+    if obtener_bandeja_salida() is None:
         st.warning("⚠️ Faltan datos de email en Secrets.")
         return False
-    
-    NUMERO_WHATSAPP = "5491153748291" 
-    id_visual = datos_extra.get('id_visual', 'S/N')
-    
-    # === GENERADOR DE CROSS SELLING ===
-    html_cross = ""
-    nombre_prod_base = datos_extra.get('nombre_producto_base', '')
-    
-    if nombre_prod_base:
-        recomendados, perfil = generar_recomendaciones(nombre_prod_base)
-        if recomendados:
-            filas = ""
-            for p in recomendados:
-                precio_fmt = f"${p['precio']:,.0f}" if p['precio'] > 0 else "Ver Precio"
-                
-                # Diseño de tarjeta de producto
-                filas += f"""
-                <td style="width: 33%; padding: 10px; text-align: center; border: 1px solid #f0f0f0; border-radius: 8px; background: #fff;">
-                    <a href="{p['url']}" style="text-decoration: none; color: #333; display: block;">
-                        <img src="{p['foto']}" alt="{p['nombre']}" style="width: 100%; max-width: 120px; height: 120px; object-fit: contain; margin-bottom: 10px;">
-                        <p style="font-size: 13px; margin: 0 0 5px; height: 36px; overflow: hidden; line-height: 1.2;"><strong>{p['nombre']}</strong></p>
-                        <p style="color: #28a745; font-weight: bold; font-size: 14px; margin: 5px 0;">{precio_fmt}</p>
-                        <div style="background: #007bff; color: white; padding: 6px 10px; border-radius: 4px; font-size: 12px; display: inline-block;">VER OFERTA</div>
-                    </a>
-                </td>
-                """
-            
-            html_cross = f"""
-            <div style="background-color: #f9f9f9; padding: 20px; border-radius: 10px; margin-top: 30px; border: 1px solid #eee;">
-                <h3 style="text-align: center; color: #444; margin-top: 0;">🔥 Recomendados para vos ({perfil}) 🔥</h3>
-                <p style="text-align: center; font-size: 13px; color: #777; margin-bottom: 15px;">Completá tu experiencia con estos accesorios:</p>
-                <table width="100%" cellpadding="5" cellspacing="5" style="border-collapse: separate; border-spacing: 10px;">
-                    <tr>{filas}</tr>
-                </table>
-            </div>
-            """
-    # ==================================
-
-    msg = MIMEMultipart()
-    msg['From'] = f"SSServicios <{SMTP_USER}>"
-    msg['To'] = email_cliente
-    style_base = "font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333; line-height: 1.6; max-width: 600px; margin: auto;"
-    
-    if escenario == 1: # RECHAZADO
-        msg['Subject'] = f"Actualización pedido #{id_visual}"
-        cuerpo_txt = f"""
-            <p>Hola <strong>{nombre_cliente}</strong>,</p>
-            <p>Recibimos tu pedido <strong>#{id_visual}</strong>. Al procesar la financiación, el sistema indica que no tenés cupo disponible actualmente.</p>
-            <p><strong>¡No pierdas tu compra!</strong> Reservamos tu pedido 24hs para que abones con transferencia o tarjeta.</p>
-            <p>Respondé este mail para solicitar el link de pago.</p>
-        """
-    elif escenario == 2: # DIFERENCIA
-        cupo = datos_extra.get('cupo', 0)
-        dif = datos_extra.get('diferencia', 0)
-        texto_ws = f"Hola SSServicios, envío comprobante diferencia pedido #{id_visual}."
-        link_ws = f"https://wa.me/{NUMERO_WHATSAPP}?text={urllib.parse.quote(texto_ws)}"
-        
-        msg['Subject'] = f"Finalizá tu pedido #{id_visual}"
-        cuerpo_txt = f"""
-            <p>Hola <strong>{nombre_cliente}</strong>,</p>
-            <p>¡Buenas noticias! Aprobamos parcialmente tu financiación.<br>
-            Cupo disponible: <strong>${cupo:,.0f}</strong></p>
-            <div style="background: #fff3cd; padding: 15px; border-left: 5px solid #ffc107; margin: 15px 0;">
-                <p style="margin:0">Resta abonar una diferencia de: <strong style="font-size:1.2em">${dif:,.0f}</strong></p>
-            </div>
-            <p><strong>Transferencia:</strong><br>Banco BBVA | CBU: 0170272120000001018527<br>Alias: SSSERVICIOS.MP</p>
-            <p style="text-align: center; margin-top: 20px;">
-                <a href="{link_ws}" style="background: #25D366; color: white; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-weight: bold;">👉 ENVIAR COMPROBANTE</a>
-            </p>
-        """
-    elif escenario == 3: # APROBADO
-        msg['Subject'] = f"¡Aprobado! Pedido #{id_visual} ✅"
-        cuerpo_txt = f"""
-            <p>Hola <strong>{nombre_cliente}</strong>,</p>
-            <p>Confirmamos que la financiación de tu pedido <strong>#{id_visual}</strong> fue <strong>APROBADA</strong>.</p>
-            <p>El importe se verá en tu próxima factura en 3 cuotas sin interés. Ya estamos preparando tu paquete.</p>
-            <p>¡Gracias por elegirnos!</p>
-        """
-    else: return False
-
-    html_final = f"""<div style="{style_base}">{cuerpo_txt}{html_cross}<br><hr style="border:0;border-top:1px solid #eee"><small style="color:#999">SSServicios Team</small></div>"""
-    msg.attach(MIMEText(html_final, 'html'))
-    
-    try:
-        if SMTP_PORT == 465: server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
-        else:
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-            server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.sendmail(SMTP_USER, email_cliente, msg.as_string())
-        server.quit()
-        return True
-    except: return False
+    ok, detalle = obtener_motor().notificar(email_cliente, nombre_cliente, escenario, datos_extra)
+    if not ok: st.error(f"📧 {detalle}")
+    elif detalle == MAIL_DUPLICADO: st.info(f"📧 {detalle}: no se manda de nuevo.")
+    return ok
 
 # ==========================================
 # 🧠 4. LÓGICA DE BÚSQUEDA Y FRONTEND
 # ==========================================
-def buscar_cliente_cascada(nombre_tn, dni_tn, nota_tn):
-    nota_segura = str(nota_tn) if nota_tn is not None else ""
-    ids_en_nota = re.findall(r'\b\d{3,7}\b', nota_segura)
-    for pid in ids_en_nota:
-        res = consultar_api_aria_id(pid)
-        if res and res[0].get('cliente_id'): return res[0], f"✅ ID {pid} (Nota)"
-
-    dni_input = solo_numeros(dni_tn)
-    numeros_a_probar = []
-    if len(dni_input) > 5: numeros_a_probar.append(dni_input)
-    if len(dni_input) == 11: numeros_a_probar.append(dni_input[2:10])
-
-    for n in numeros_a_probar:
-        res = consultar_api_aria({'ident': n})
-        if res:
-            for c in res:
-                da = solo_numeros(c.get('cliente_dnicuit',''))
-                if n in da or da in n: return c, f"✅ Doc {n}"
-        res_q = consultar_api_aria({'q': n})
-        if res_q:
-            for c in res_q:
-                da = solo_numeros(c.get('cliente_dnicuit',''))
-                if n in da or da in n: return c, f"✅ Doc Q {n}"
-
-    partes = nombre_tn.replace(",","").split()
-    if len(partes) >= 1:
-        ape = partes[-1]
-        if len(ape) > 3:
-            res = consultar_api_aria({'q': ape})
-            if res:
-                if numeros_a_probar:
-                    dni_obj = numeros_a_probar[-1]
-                    for c in res:
-                        if dni_obj in solo_numeros(c.get('cliente_dnicuit','')): return c, "✅ Apellido + DNI"
-                else:
-                    ptn = set(nombre_tn.lower().split())
-                    for c in res:
-                        nom_aria = (str(c.get('cliente_nombre',''))+" "+str(c.get('cliente_apellido',''))).lower()
-                        if len(ptn.intersection(set(nom_aria.split()))) >= 2: return c, "✅ Nombre Coincidente"
-    return None, "❌ No encontrado"
-
-def extraer_productos(pedido):
-    return ", ".join([f"{i.get('name')} ({i.get('quantity')})" for i in pedido.get('products', [])])
+def buscar_cliente_cascada(nombre_tn, dni_tn, nota_tn, pedido_id=None):
+    return obtener_motor().buscar_cliente(nombre_tn, dni_tn, nota_tn, pedido_id)
+
+def aprobables_con_cupo(pedidos):
+    """Los pedidos analizados como APROBABLES, cada uno contra lo que le queda al cliente después de los anteriores."""
+    cupos, ids = CuposEnCurso(), []
+    for p in pedidos:
+        cli = st.session_state['analisis_resultados'].get(p.id, (None, None))[0]
+        if cli and cupos.evaluar(cli, p.total)[0] == APROBABLE:
+            cupos.reservar(cli, p.total)
+            ids.append(p.id)
+    return ids
+
+def cupo_consumido(id_pedido, cliente_id):
+    """Después de aprobar: olvida el cupo cacheado del cliente y los análisis de sus otros pedidos (hay que rehacerlos)."""
+    obtener_cliente_aria().invalidar_cliente(cliente_id)
+    for pid, (cli, _) in list(st.session_state['analisis_resultados'].items()):
+        if pid != id_pedido and cli and str(cli.get('cliente_id')) == str(cliente_id):
+            del st.session_state['analisis_resultados'][pid]
+
+def analizar_pedido(p):
+    """Cascada de un pedido, con su resultado registrado en la analítica."""
+    cli, msg = buscar_cliente_cascada(p.cliente_nombre, p.cliente_ident, p.owner_note, p.id)
+    obtener_motor().registrar_analisis(p, cli, msg)
+    return cli, msg
 
 # --- INTERFAZ ---
 st.set_page_config(page_title="Gestor SSServicios", page_icon="🤖", layout="wide")
 st.title("🤖 Gestor de Ventas Contrafactura")
-
-st.sidebar.header("🔎 Consulta Rápida")
-id_manual = st.sidebar.text_input("ID Cliente:", placeholder="Ej: 7113")
-if st.sidebar.button("Consultar Cupo"):
-    if not id_manual: st.sidebar.warning("Ingresa un número.")
-    else:
-        with st.spinner("Buscando..."):
-            res_manual = consultar_api_aria_id(id_manual)
-            if res_manual and res_manual[0].get('cliente_id'):
-                cli_m = res_manual[0]
-                nom_m = f"{cli_m.get('cliente_nombre','')} {cli_m.get('cliente_apellido','')}"
-                try: cupo_m = float(cli_m.get('clienteScoringFinanciable', 0))
-                except: cupo_m = 0.0
-                meses_m = int(cli_m.get('cliente_meses_atraso', 0) or 0)
-                st.sidebar.success(f"✅ **{nom_m}**")
-                st.sidebar.metric("Cupo Disponible", f"${cupo_m:,.0f}")
-                if meses_m > 0: st.sidebar.error(f"⛔ Mora: {meses_m} meses")
-                else: st.sidebar.info("✅ Al día")
-            else: st.sidebar.error("❌ Cliente no existe.")
-
-if st.sidebar.button("🔄 Actualizar Todo"): st.rerun()
-
-tab_nuevos, tab_pendientes, tab_aprobados, tab_cancelados = st.tabs(["📥 NUEVOS", "⏳ PENDIENTES", "✅ APROBADOS", "🚫 CANCELADOS"])
-
-with st.spinner('Sincronizando Tiendanube...'):
-    pedidos_open = obtener_pedidos("open")
-    pedidos_closed = obtener_pedidos("closed")
-    pedidos_todos = pedidos_open + pedidos_closed
+# Lo que se registre en este rerun (acá, en el loop de E/S y en los pools) lleva su corrida;
+# otras sesiones y los hilos de fondo no entran en el desglose
+st.session_state['corrida_metricas'] = METRICAS.iniciar_corrida()
+
+# Cada panel es un fragmento: un click adentro re-ejecuta sólo ese panel, sin sincronizar
+# ni volver a leer las pestañas. Las acciones que cambian un pedido sí piden un rerun completo.
+def fragmento(funcion):
+    """st.fragment que, cuando se re-ejecuta solo, mide su costo como una corrida propia."""
+    @functools.wraps(funcion)
+    def medida(*args, **kw):
+        propia = METRICAS.corrida_actual() is None  # Dentro de un rerun completo es parte de esa corrida
+        if propia: st.session_state['corrida_metricas'] = METRICAS.iniciar_corrida()
+        try: return funcion(*args, **kw)
+        finally:
+            if propia: METRICAS.terminar_corrida()
+    return st.fragment(medida)
+
+@fragmento
+def consulta_rapida():
+    st.header("🔎 Consulta Rápida")
+    id_manual = st.text_input("ID Cliente:", placeholder="Ej: 7113")
+    if st.button("Consultar Cupo"):
+        if not id_manual: st.warning("Ingresa un número.")
+        else:
+            with st.spinner("Buscando..."):
+                res_manual = consultar_api_aria_id(id_manual)
+                if res_manual and res_manual[0].get('cliente_id'):
+                    cli_m = res_manual[0]
+                    nom_m = f"{cli_m.get('cliente_nombre','')} {cli_m.get('cliente_apellido','')}"
+                    try: cupo_m = float(cli_m.get('clienteScoringFinanciable', 0))
+                    except (TypeError, ValueError): cupo_m = 0.0
+                    meses_m = int(cli_m.get('cliente_meses_atraso', 0) or 0)
+                    st.success(f"✅ **{nom_m}**")
+                    st.metric("Cupo Disponible", f"${cupo_m:,.0f}")
+                    if meses_m > 0: st.error(f"⛔ Mora: {meses_m} meses")
+                    else: st.info("✅ Al día")
+                else: st.error("❌ Cliente no existe.")
+
+with st.sidebar: consulta_rapida()
+
+stats_aria = obtener_cliente_aria().cache.estadisticas()
+if obtener_cliente_aria().transporte.disyuntor.abierto: st.sidebar.warning("⚠️ ARIA no responde; se reintenta en unos segundos.")
+bandeja = obtener_bandeja_salida()
+bandeja_stats = bandeja.estadisticas() if bandeja else {}
+st.sidebar.caption(f"Mails: {bandeja_stats.get('pendiente', 0)} en cola · {bandeja_stats.get('enviado', 0)} enviados · {bandeja_stats.get('fallido', 0)} fallidos")
+st.sidebar.caption(f"Cache ARIA: {stats_aria['hits']} hits · {stats_aria['hits_vacios']} vacíos · {stats_aria['misses']} misses · {stats_aria['items']} items")
+
+TAM_PAGINA = st.sidebar.selectbox("Pedidos por página", TAMANIOS_PAGINA, index=1, key="tam_pagina")
+forzar_sync = st.sidebar.button("🔄 Actualizar Todo")
+
+tab_nuevos, tab_pendientes, tab_aprobados, tab_cancelados, tab_analitica = st.tabs(
+    ["📥 NUEVOS", "⏳ PENDIENTES", "✅ APROBADOS", "🚫 CANCELADOS", "📊 ANALÍTICA"])
+
+# Con webhooks, cargar la página es sólo leer el almacén; "Actualizar Todo" fuerza un delta igual
+if not WEBHOOKS_ACTIVOS or forzar_sync:
+    with st.spinner('Sincronizando Tiendanube...'):
+        sincronizar_pedidos()
+almacen = obtener_almacen()
+obtener_catalogo()  # La primera vez arranca el precalentamiento del cross-selling
+
+def cambiar_pagina(nombre, paso):
+    st.session_state[f"pag_{nombre}"] = st.session_state.get(f"pag_{nombre}", 0) + paso
+
+def pagina_de(nombre):
+    """Pedidos de la página actual de una pestaña, leídos del almacén con limit/offset: (pedidos, total)."""
+    total = almacen.contar(nombre)
+    paginas = max(1, -(-total // TAM_PAGINA))
+    pagina = min(st.session_state.get(f"pag_{nombre}", 0), paginas - 1)
+    st.session_state[f"pag_{nombre}"] = pagina
+    if paginas > 1:
+        c_ant, c_pag, c_sig = st.columns([1, 3, 1])
+        c_ant.button("◀", key=f"ant_{nombre}", disabled=pagina == 0, on_click=cambiar_pagina, args=(nombre, -1))
+        c_pag.caption(f"Página {pagina + 1} de {paginas}")
+        c_sig.button("▶", key=f"sig_{nombre}", disabled=pagina >= paginas - 1, on_click=cambiar_pagina, args=(nombre, 1))
+    return almacen.bandeja(nombre, limite=TAM_PAGINA, desde=pagina * TAM_PAGINA), total
+
+@fragmento
+def panel_nuevo(p, slots_lote):
+    id_real = p.id
+    id_visual = p.id_visual
+    nom = p.cliente_nombre
+    mail = p.cliente_email
+    total = p.total
+    nota = p.owner_note
+    productos_pedido = p.nombres_productos
+
+    with st.expander(f"🆕 #{id_visual} | {nom} | ${total:,.0f}", expanded=bool(st.session_state['analisis_activo'].get(id_real))):
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            st.markdown(f"**Items:** {p.resumen_productos}")
+            st.markdown(f"**Nota:** {nota}")
+        with c2:
+            if st.button(f"🔍 Analizar", key=f"an_{id_real}"): st.session_state['analisis_activo'][id_real] = True
+            slots_lote[id_real] = st.empty()
+
+            if st.session_state['analisis_activo'].get(id_real):
+                st.markdown("---")
+                # El resultado queda en la sesión: re-ejecutar el panel no repite la cascada
+                if id_real not in st.session_state['analisis_resultados']:
+                    st.session_state['analisis_resultados'][id_real] = analizar_pedido(p)
+                cli, msg = st.session_state['analisis_resultados'][id_real]
+
+                if not cli:
+                    st.error(msg)
+                    st.warning("Busca ID Manual 👈")
+                else:
+                    decision, cupo, meses = evaluar_credito(cli, total)
+                    st.success(f"{msg} (Cupo: ${cupo:,.0f})")
+
+                    if decision == MORA:
+                        st.error(f"⛔ MORA: {meses} meses")
+                        if st.button("📧 Rechazar (Mora)", key=f"r_{id_real}"):
+                            if enviar_notificacion(mail, nom, 1, {'id_visual': id_visual, 'nombres_productos': productos_pedido}):
+                                actualizar_etiqueta(p, TAG_PENDIENTE)
+                                st.toast("Rechazado enviado."); st.rerun()
+                    elif decision == APROBABLE:
+                        st.success("🚀 APROBABLE")
+                        if st.button("📧 APROBAR + Mail", key=f"ok_{id_real}"):
+                            if aprobar_orden_completa(p, TAG_APROBADO):
+                                cupo_consumido(id_real, cli.get('cliente_id'))
+                                enviar_notificacion(mail, nom, 3, {'id_visual': id_visual, 'nombres_productos': productos_pedido})
+                                st.toast("¡Aprobado!"); st.rerun()
+                    else:
+                        dif = total - cupo
+                        st.warning(f"⚠️ Faltan ${dif:,.0f}")
+                        if st.button("📧 Pedir Diferencia", key=f"dif_{id_real}"):
+                            if enviar_notificacion(mail, nom, 2, {'cupo': cupo, 'diferencia': dif, 'id_visual': id_visual, 'nombres_productos': productos_pedido}):
+                                actualizar_etiqueta(p, TAG_PENDIENTE)
+                                st.toast("Solicitud enviada."); st.rerun()
+
+                if st.button("Cerrar", key=f"x_{id_real}"):
+                    del st.session_state['analisis_activo'][id_real]
+                    st.session_state['analisis_resultados'].pop(id_real, None)
+                    st.rerun(scope="fragment")
+
+@fragmento
+def panel_pendiente(p):
+    id_real = p.id
+    id_visual = p.id_visual
+    nom = p.cliente_nombre
+    productos_pedido = p.nombres_productos
+
+    with st.expander(f"⏳ #{id_visual} | {nom}"):
+        st.markdown(f"**Items:** {p.resumen_productos}")
+        c_ok, c_kill = st.columns(2)
+        if c_ok.button("✅ Confirmar + Mail", key=f"pok_{id_real}"):
+            if aprobar_orden_completa(p, TAG_APROBADO, TAG_PENDIENTE):
+                # El cliente sale de la resolución guardada del pedido (los tags no cambian su huella)
+                resuelto = obtener_motor().almacen.resoluciones({id_real: datos_cliente(p)}).get(id_real)
+                if resuelto: obtener_cliente_aria().invalidar_cliente(resuelto[0])
+                enviar_notificacion(p.cliente_email, nom, 3, {'id_visual': id_visual, 'nombres_productos': productos_pedido})
+                st.toast("Confirmado!"); st.rerun()
+        if c_kill.button("🚫 Cancelar", key=f"kill_{id_real}"):
+            cancelar_orden_tn(p)
+            st.toast("Cancelado."); st.rerun()
 
 # --- PESTAÑA: NUEVOS ---
-with tab_nuevos:
-    p_nuevos = [p for p in pedidos_todos if p['status']=='open' and p['payment_status']=='pending' and TAG_PENDIENTE not in (p.get('owner_note') or "") and TAG_APROBADO not in (p.get('owner_note') or "")]
-    
+@fragmento
+def pestana_nuevos():
+    p_nuevos, total_nuevos = pagina_de("nuevos")
+
     if not p_nuevos: st.info("✅ Bandeja limpia.")
     else:
-        st.write(f"**{len(p_nuevos)}** pedidos nuevos.")
-        for p in p_nuevos:
-            id_real = p['id']
-            id_visual = p.get('number', id_real)
-            nom = p['customer']['name']
-            mail = p['customer'].get('email')
-            total = float(p['total'])
-            nota = p.get('owner_note') or ""
-            prods_txt = extraer_productos(p)
-            nombre_prod_principal = p['products'][0]['name'] if p['products'] else ""
-
-            with st.expander(f"🆕 #{id_visual} | {nom} | ${total:,.0f}", expanded=True):
-                c1, c2 = st.columns([1, 1])
-                with c1:
-                    st.markdown(f"**Items:** {prods_txt}")
-                    st.markdown(f"**Nota:** {nota}")
-                with c2:
-                    if st.button(f"🔍 Analizar", key=f"an_{id_real}"): st.session_state['analisis_activo'][id_real] = True
-                    
-                    if st.session_state['analisis_activo'].get(id_real):
-                        st.markdown("---")
-                        cli, msg = buscar_cliente_cascada(nom, p['customer'].get('identification'), nota)
-                        
-                        if not cli:
-                            st.error(msg)
-                            st.warning("Busca ID Manual 👈")
-                        else:
-                            cupo = float(cli.get('clienteScoringFinanciable', 0))
-                            meses = int(cli.get('cliente_meses_atraso', 0) or 0)
-                            st.success(f"{msg} (Cupo: ${cupo:,.0f})")
-                            
-                            if meses > 0:
-                                st.error(f"⛔ MORA: {meses} meses")
-                                if st.button("📧 Rechazar (Mora)", key=f"r_{id_real}"):
-                                    if enviar_notificacion(mail, nom, 1, {'id_visual': id_visual, 'nombre_producto_base': nombre_prod_principal}):
-                                        actualizar_etiqueta(id_real, nota, TAG_PENDIENTE)
-                                        st.toast("Rechazado enviado."); time.sleep(2); st.rerun()
-                            elif total <= cupo:
-                                st.success("🚀 APROBABLE")
-                                if st.button("📧 APROBAR + Mail", key=f"ok_{id_real}"):
-                                    if aprobar_orden_completa(id_real, nota, TAG_APROBADO):
-                                        enviar_notificacion(mail, nom, 3, {'id_visual': id_visual, 'nombre_producto_base': nombre_prod_principal})
-                                        st.toast("¡Aprobado!"); time.sleep(2); st.rerun()
-                            else:
-                                dif = total - cupo
-                                st.warning(f"⚠️ Faltan ${dif:,.0f}")
-                                if st.button("📧 Pedir Diferencia", key=f"dif_{id_real}"):
-                                    if enviar_notificacion(mail, nom, 2, {'cupo': cupo, 'diferencia': dif, 'id_visual': id_visual, 'nombre_producto_base': nombre_prod_principal}):
-                                        actualizar_etiqueta(id_real, nota, TAG_PENDIENTE)
-                                        st.toast("Solicitud enviada."); time.sleep(2); st.rerun()
-                        
-                        if st.button("Cerrar", key=f"x_{id_real}"):
-                            del st.session_state['analisis_activo'][id_real]
-                            st.rerun()
+        st.write(f"**{total_nuevos}** pedidos nuevos.")
+        analizar_todos = st.button("⚡ Analizar página", key="an_todos")
+        barra_lote = st.empty()
+
+        with st.expander("📦 Acciones en lote", expanded=bool(st.session_state.get('resultado_lote'))):
+            for etiqueta, ok, detalle in st.session_state.pop('resultado_lote', []):
+                (st.success if ok else st.error)(f"{etiqueta}: {detalle}")
+
+            por_id = {p.id: p for p in p_nuevos}
+            etiquetas = {pid: f"#{p.id_visual} | {p.cliente_nombre} | ${p.total:,.0f}" for pid, p in por_id.items()}
+            aprobables = aprobables_con_cupo(p_nuevos)
+
+            if st.session_state.pop('limpiar_sel_lote', False): st.session_state['sel_lote'] = []
+            # La selección es de la página actual; lo que quedó de otra página se descarta
+            st.session_state['sel_lote'] = [pid for pid in st.session_state.get('sel_lote', []) if pid in etiquetas]
+            if st.button(f"Seleccionar APROBABLES ({len(aprobables)})", key="sel_aprobables"): st.session_state['sel_lote'] = aprobables
+            seleccion = st.multiselect("Pedidos", options=list(etiquetas), format_func=etiquetas.get, key="sel_lote")
+            b_ok, b_pend, b_kill = st.columns(3)
+            accion = None
+            if b_ok.button("✅ Aprobar + Mail", key="lote_ok", disabled=not seleccion): accion = "aprobar"
+            if b_pend.button("⏳ Marcar pendiente", key="lote_pend", disabled=not seleccion): accion = "etiquetar"
+            if b_kill.button("🚫 Cancelar", key="lote_kill", disabled=not seleccion): accion = "cancelar"
+
+            if accion:
+                resultados = []
+                pedidos_lote = [por_id[pid] for pid in seleccion if pid in por_id]
+                if accion == "aprobar":
+                    # Sólo se aprueba lo que el análisis marcó APROBABLE, con el cupo de cada cliente repartido
+                    # entre sus pedidos de la selección; el resto se informa y no se toca
+                    con_cupo = aprobables_con_cupo(pedidos_lote)
+                    resultados += [(etiquetas[p.id], False, "No está analizado como APROBABLE (o el cupo del cliente no alcanza para todos)")
+                                   for p in pedidos_lote if p.id not in con_cupo]
+                    pedidos_lote = [p for p in pedidos_lote if p.id in con_cupo]
+                    clientes = {p.id: st.session_state['analisis_resultados'][p.id][0].get('cliente_id') for p in pedidos_lote}
+                args = {"aprobar": (TAG_APROBADO,), "etiquetar": (TAG_PENDIENTE,), "cancelar": ()}[accion]
+                with st.spinner(f"Procesando {len(pedidos_lote)} pedidos..."):
+                    for pid, ok, detalle in obtener_escritor().en_lote(accion, pedidos_lote, *args):
+                        if ok and accion == "aprobar":
+                            p = por_id[pid]
+                            cupo_consumido(pid, clientes[pid])
+                            enviar_notificacion(p.cliente_email, p.cliente_nombre, 3, {
+                                'id_visual': p.id_visual,
+                                'nombres_productos': p.nombres_productos,
+                            })
+                        resultados.append((etiquetas[pid], ok, detalle))
+                st.session_state['resultado_lote'] = resultados
+                st.session_state['limpiar_sel_lote'] = True
+                st.rerun()
+
+        slots_lote = {}
+        for p in p_nuevos: panel_nuevo(p, slots_lote)
+
+        if analizar_todos:
+            # Cascada para toda la página a la vez; los resultados se van mostrando a medida que llegan
+            solicitudes = {p.id: (p.cliente_nombre, p.cliente_ident, p.owner_note)
+                           for p in p_nuevos if p.id not in st.session_state['analisis_resultados']}
+            progreso = barra_lote.progress(0.0, text=f"Analizando {len(solicitudes)} pedidos...")
+            for i, (id_real, cli, msg) in enumerate(obtener_motor().analizar_lote(solicitudes), start=1):
+                obtener_motor().registrar_analisis(por_id[id_real], cli, msg)
+                st.session_state['analisis_resultados'][id_real] = (cli, msg)
+                st.session_state['analisis_activo'][id_real] = True
+                if cli: slots_lote[id_real].success(msg)
+                else: slots_lote[id_real].error(msg)
+                progreso.progress(i / len(solicitudes), text=f"Analizados {i}/{len(solicitudes)}")
+            st.rerun(scope="fragment")
 
 # --- PESTAÑA: PENDIENTES ---
-with tab_pendientes:
-    p_pend = [p for p in pedidos_todos if p['status']=='open' and p['payment_status']=='pending' and TAG_PENDIENTE in (p.get('owner_note') or "")]
-    st.write(f"**{len(p_pend)}** esperando.")
-    for p in p_pend:
-        id_real = p['id']
-        id_visual = p.get('number', id_real)
-        nom = p['customer']['name']
-        nombre_prod_principal = p['products'][0]['name'] if p['products'] else ""
-        
-        with st.expander(f"⏳ #{id_visual} | {nom}", expanded=True):
-            c_ok, c_kill = st.columns(2)
-            if c_ok.button("✅ Confirmar + Mail", key=f"pok_{id_real}"):
-                if aprobar_orden_completa(id_real, p.get('owner_note'), TAG_APROBADO, TAG_PENDIENTE):
-                    enviar_notificacion(p['customer'].get('email'), nom, 3, {'id_visual': id_visual, 'nombre_producto_base': nombre_prod_principal})
-                    st.toast("Confirmado!"); time.sleep(2); st.rerun()
-            if c_kill.button("🚫 Cancelar", key=f"kill_{id_real}"):
-                cancelar_orden_tn(id_real)
-                st.toast("Cancelado."); time.sleep(2); st.rerun()
+@fragmento
+def pestana_pendientes():
+    p_pend, total_pend = pagina_de("pendientes")
+    st.write(f"**{total_pend}** esperando.")
+    for p in p_pend: panel_pendiente(p)
 
 # --- PESTAÑA: APROBADOS ---
-with tab_aprobados:
-    p_ok = [p for p in pedidos_todos if ((p.get('payment_status')=='paid' or TAG_APROBADO in (p.get('owner_note') or "")) and p['status']!='cancelled')]
-    st.write(f"**{len(p_ok)}** aprobados.")
-    for p in p_ok[:20]:
-        icono = "🟢" if p.get('payment_status')=='paid' else "⚠️"
-        st.caption(f"{icono} #{p.get('number')} - {p['customer']['name']} - ${float(p['total']):,.0f}")
+@fragmento
+def pestana_aprobados():
+    p_aprob, total_aprob = pagina_de("aprobados")
+    st.write(f"**{total_aprob}** aprobados.")
+    for p in p_aprob:
+        icono = "🟢" if p.payment_status=='paid' else "⚠️"
+        st.caption(f"{icono} #{p.numero} - {p.cliente_nombre} - ${p.total:,.0f}")
 
 # --- PESTAÑA: CANCELADOS ---
-with tab_cancelados:
-    p_can = [p for p in pedidos_todos if p['status']=='cancelled']
-    st.write(f"**{len(p_can)}** cancelados.")
-    for p in p_can[:10]: st.caption(f"🚫 #{p.get('number')} - {p['customer']['name']}")
+@fragmento
+def pestana_cancelados():
+    p_canc, total_canc = pagina_de("cancelados")
+    st.write(f"**{total_canc}** cancelados.")
+    for p in p_canc: st.caption(f"🚫 #{p.numero} - {p.cliente_nombre}")
+
+# --- PESTAÑA: ANALÍTICA ---
+# Lee sólo los rollups diarios (analitica.py): cuesta lo mismo con una semana que con un año de historia
+@fragmento
+def pestana_analitica():
+    dias = st.selectbox("Período", PERIODOS_ANALITICA, index=1, format_func=lambda d: f"Últimos {d} días", key="periodo_analitica")
+    desde = (datetime.date.today() - datetime.timedelta(days=dias - 1)).isoformat()
+    analitica = obtener_motor().analitica
+    analisis = analitica.analisis(desde)
+
+    por_decision = {}
+    for fila in analisis:
+        acumulado = por_decision.setdefault(fila['decision'], {'pedidos': 0, 'suma_total': 0.0, 'suma_cupo': 0.0})
+        for campo in acumulado: acumulado[campo] += fila[campo]
+    con_cliente = sum(d['pedidos'] for decision, d in por_decision.items() if decision != SIN_CLIENTE)
+    analizados = con_cliente + por_decision.get(SIN_CLIENTE, {}).get('pedidos', 0)
+    aprobables = por_decision.get(APROBABLE, {'pedidos': 0, 'suma_total': 0.0, 'suma_cupo': 0.0})
+    diferencia = por_decision.get(DIFERENCIA, {'pedidos': 0, 'suma_total': 0.0, 'suma_cupo': 0.0})
+
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Analizados", analizados, help="Pedidos con cascada en el período (cada pedido cuenta una vez)")
+    k2.metric("Tasa de aprobación", f"{aprobables['pedidos'] / con_cliente:.0%}" if con_cliente else "—",
+              help="APROBABLES sobre pedidos con cliente encontrado")
+    k3.metric("Diferencia promedio", f"${(diferencia['suma_total'] - diferencia['suma_cupo']) / diferencia['pedidos']:,.0f}"
+              if diferencia['pedidos'] else "—", help="Total del pedido menos cupo, en los casos DIFERENCIA")
+    k4.metric("Uso del cupo", f"{aprobables['suma_total'] / aprobables['suma_cupo']:.0%}" if aprobables['suma_cupo'] else "—",
+              help="Total aprobable sobre el cupo de esos clientes")
+
+    st.caption("Pedidos que entraron a cada bandeja, por día")
+    por_dia = analitica.bandejas_por_dia(desde)
+    if por_dia: st.bar_chart(por_dia, x="dia", y=["nuevos", "pendientes", "aprobados", "cancelados"])
+    else: st.info("Sin movimientos en el período.")
+
+    c_met, c_perf = st.columns(2)
+    with c_met:
+        st.caption("Método de la cascada")
+        metodos = {}
+        for fila in analisis: metodos[fila['metodo']] = metodos.get(fila['metodo'], 0) + fila['pedidos']
+        st.dataframe([{'método': m, 'pedidos': n, '%': round(100 * n / analizados, 1)} for m, n in sorted(metodos.items(), key=lambda x: -x[1])],
+                     hide_index=True, use_container_width=True)
+    with c_perf:
+        st.caption("Mails encolados por escenario y perfil")
+        st.dataframe([{'escenario': ESCENARIOS_ANALITICA.get(f['escenario'], f['escenario']), 'perfil': f['perfil'] or "—", 'mails': f['mails']}
+                      for f in analitica.notificaciones(desde)], hide_index=True, use_container_width=True)
+
+with tab_nuevos: pestana_nuevos()
+with tab_pendientes: pestana_pendientes()
+with tab_aprobados: pestana_aprobados()
+with tab_cancelados: pestana_cancelados()
+with tab_analitica: pestana_analitica()
+
+METRICAS.terminar_corrida()
+
+# --- PANEL DE RENDIMIENTO ---
+# Fragmento sin corrida propia: "↻" muestra la última ejecución de la sesión (un rerun o un panel solo)
+@st.fragment
+def panel_rendimiento():
+    c_tit, c_act = st.columns([4, 1])
+    c_tit.caption("Última ejecución de esta sesión (ms)")
+    c_act.button("↻", key="act_rendimiento")
+    desglose = METRICAS.desglose(corrida=st.session_state.get('corrida_metricas'))
+    st.dataframe([{'métrica': n, **e, 'n': c, 'ms': round(seg * 1000, 1)} for n, e, c, seg in desglose],
+                 hide_index=True, use_container_width=True)
+
+with st.sidebar.expander("⏱️ Rendimiento"):
+    panel_rendimiento()
+    st.caption("Acumulado: p50 / p95 (ms)")
+    st.dataframe([{'métrica': r['metrica'], **r['etiquetas'], 'n': r['n'], 'p50': round(r['p50'] * 1000, 1), 'p95': round(r['p95'] * 1000, 1)}
+                  for r in METRICAS.resumen()], hide_index=True, use_container_width=True)
+    errores = [c for c in METRICAS.contadores() if c['metrica'] == "errores"]
+    if errores: st.caption("Errores: " + " · ".join(f"{c['etiquetas'].get('upstream')}/{c['etiquetas'].get('tipo')}: {c['valor']}" for c in errores))
+    st.download_button("Exportar JSON lines", METRICAS.exportar_jsonl(), file_name="metricas.jsonl", mime="application/jsonl")
+    st.download_button("Exportar Prometheus", METRICAS.exportar_prometheus(), file_name="metricas.prom", mime="text/plain")
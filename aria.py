@@ -0,0 +1,304 @@
+"""
+Cliente de la API de ARIA y búsqueda en cascada de clientes.
+
+Todas las consultas pasan por el transporte de ARIA: keep-alive, tope de
+consultas simultáneas (el análisis en lote no satura ARIA), reintentos y un
+disyuntor que corta rápido si ARIA está caída.
+Las respuestas se guardan en un CacheTTL compartido, clave = endpoint + params
+normalizados; los resultados vacíos también (cache negativo), pero sólo si ARIA
+respondió (200 vacío o 404): una consulta fallida no se cachea y la cascada la
+informa aparte.
+Cada paso de la cascada se mide por separado en las métricas.
+
+La cascada se arma como un plan de consultas ordenado por precedencia y corre
+sobre el event loop compartido (bucle.py): de a una, o todas juntas quedándose con
+la de mayor precedencia que encuentre al cliente.
+"""
+import asyncio
+import re
+import threading
+from concurrent.futures import Future
+
+from cache import CacheTTL
+from metricas import METRICAS
+from transporte import CircuitoAbierto, CuboTokens, Disyuntor, Transporte
+
+ARIA_URL_BASE = "https://api.anatod.ar/api"
+NO_ENCONTRADO = "❌ No encontrado"
+NO_RESPONDE = "⚠️ ARIA no respondió"
+
+# (conexión, lectura) por endpoint
+ARIA_TIMEOUTS = {
+    "/cliente/": (3, 5),
+    "/clientes": (3, 8),
+}
+
+
+def solo_numeros(texto):
+    if texto is None: return ""
+    return re.sub(r'\D', '', str(texto))
+
+
+def _clave_params(params):
+    return tuple(sorted((k, str(v).strip().lower()) for k, v in params.items()))
+
+
+class _ConsultaFallida(tuple):
+    """Resultado vacío de una consulta que no llegó a responder (timeout, error de red, 5xx/429, disyuntor abierto)."""
+
+
+CONSULTA_FALLIDA = _ConsultaFallida()
+
+
+def metodo_de(mensaje):
+    """El método de la cascada sin los números: "✅ Doc Q 2012345" -> "Doc Q"."""
+    return " ".join(w for w in str(mensaje).split()[1:] if not w.isdigit())
+
+
+def _con_id(mensaje):
+    return lambda res: (res[0], mensaje) if res and res[0].get('cliente_id') else None
+
+
+def _por_documento(n, mensaje):
+    def evaluar(res):
+        for c in res or []:
+            da = solo_numeros(c.get('cliente_dnicuit',''))
+            if n in da or da in n: return c, mensaje
+        return None
+    return evaluar
+
+
+def _por_apellido(nombre_tn, numeros_a_probar):
+    def evaluar(res):
+        if not res: return None
+        if numeros_a_probar:
+            dni_obj = numeros_a_probar[-1]
+            for c in res:
+                if dni_obj in solo_numeros(c.get('cliente_dnicuit','')): return c, "✅ Apellido + DNI"
+        else:
+            ptn = set(nombre_tn.lower().split())
+            for c in res:
+                nom_aria = (str(c.get('cliente_nombre',''))+" "+str(c.get('cliente_apellido',''))).lower()
+                if len(ptn.intersection(set(nom_aria.split()))) >= 2: return c, "✅ Nombre Coincidente"
+        return None
+    return evaluar
+
+
+def _paso_previo(previo):
+    cliente_id, mensaje = previo
+    return ("memo", "consultar_id", cliente_id, _con_id(mensaje))
+
+
+def _sondear(paso, funcion, arg):
+    with METRICAS.medir("cascada_paso", paso=paso) as medicion:
+        res = funcion(arg)
+        medicion['resultado'] = "con_datos" if res else "fallida" if res is CONSULTA_FALLIDA else "vacio"
+    return res
+
+
+class ClienteAria:
+    def __init__(self, api_key, url_base=ARIA_URL_BASE, max_por_host=4, cache=None):
+        self.url_base = url_base
+        self.cache = cache if cache is not None else CacheTTL()
+        self.transporte = Transporte(
+            url_base, {"x-api-key": api_key, "Content-Type": "application/json"},
+            pool=max_por_host, max_concurrentes=max_por_host, timeouts=ARIA_TIMEOUTS, reintentos=2,
+            limitador=CuboTokens(capacidad=20, ritmo=10.0), disyuntor=Disyuntor(umbral=5, pausa=30), nombre="aria",
+        )
+        self.indice = None  # IndiceDocumentos opcional: resuelve documentos sin salir a la red
+
+    def _cacheada(self, clave, funcion):
+        encontrado, valor = self.cache.obtener(clave)
+        if encontrado: return valor
+        try: valor = funcion()
+        except CircuitoAbierto: return CONSULTA_FALLIDA
+        # Sólo se cachea lo que ARIA contestó: un vacío por error no es "no existe"
+        if valor is not CONSULTA_FALLIDA: self.cache.guardar(clave, valor)
+        return valor
+
+    def consultar_id(self, cliente_id):
+        return self._cacheada(("/cliente", str(cliente_id).strip()), lambda: self._consultar_id(cliente_id))
+
+    def consultar(self, params):
+        return self._cacheada(("/clientes", _clave_params(params)), lambda: self._consultar(params))
+
+    def invalidar_cliente(self, cliente_id):
+        """Olvida todo lo cacheado sobre un cliente (p. ej. después de aprobarle un pedido, que le consume cupo)."""
+        cid = str(cliente_id)
+        def es_del_cliente(clave, valor):
+            if clave == ("/cliente", cid): return True
+            return any(str(c.get('cliente_id')) == cid for c in valor if isinstance(c, dict))
+        return self.cache.invalidar_si(es_del_cliente)
+
+    def _consultar_id(self, cliente_id):
+        try:
+            res = self.transporte.get(f"/cliente/{cliente_id}")
+            if res.status_code == 200:
+                d = res.json()
+                if isinstance(d, list): return d
+                if isinstance(d, dict): return [d]
+                return []
+            if res.status_code == 404: return []  # ID inexistente: es una respuesta, se cachea como vacío
+            METRICAS.contar("errores", upstream="aria", endpoint="/cliente/{id}", tipo=f"http_{res.status_code}")
+            return CONSULTA_FALLIDA
+        except CircuitoAbierto: raise
+        except Exception as e:
+            METRICAS.contar("errores", upstream="aria", endpoint="/cliente/{id}", tipo=type(e).__name__)
+            return CONSULTA_FALLIDA
+
+    def _consultar(self, params):
+        try:
+            res = self.transporte.get("/clientes", params=params)
+            if res.status_code == 200:
+                d = res.json()
+                if isinstance(d, dict) and "data" in d: return d["data"]
+                if isinstance(d, list): return d
+                if isinstance(d, dict): return [d]
+                return []
+            if res.status_code == 404: return []
+            METRICAS.contar("errores", upstream="aria", endpoint="/clientes", tipo=f"http_{res.status_code}")
+            return CONSULTA_FALLIDA
+        except CircuitoAbierto: raise
+        except Exception as e:
+            METRICAS.contar("errores", upstream="aria", endpoint="/clientes", tipo=type(e).__name__)
+            return CONSULTA_FALLIDA
+
+    def listar_clientes(self, por_pagina=500):
+        """Recorre el padrón completo de /clientes página por página (para el snapshot local)."""
+        pagina = 1
+        while True:
+            res = self.transporte.get("/clientes", params={'page': pagina, 'per_page': por_pagina}, timeout=(5, 30))
+            res.raise_for_status()
+            d = res.json()
+            lote = d.get("data", []) if isinstance(d, dict) else d
+            yield from lote
+            ultima = d.get("last_page") if isinstance(d, dict) else None
+            if not lote or (ultima is not None and pagina >= ultima) or (ultima is None and len(lote) < por_pagina): return
+            pagina += 1
+
+    def plan_cascada(self, nombre_tn, dni_tn, nota_tn):
+        """
+        Los pasos de la cascada en orden de precedencia: [(paso, consulta, argumento, evaluar)].
+        `consulta` es "consultar_id" o "consultar"; evaluar(resultado) da (cliente, mensaje) o None.
+        """
+        plan = []
+        nota_segura = str(nota_tn) if nota_tn is not None else ""
+        for pid in re.findall(r'\b\d{3,7}\b', nota_segura):
+            plan.append(("nota", "consultar_id", pid, _con_id(f"✅ ID {pid} (Nota)")))
+
+        dni_input = solo_numeros(dni_tn)
+        numeros_a_probar = []
+        if len(dni_input) > 5: numeros_a_probar.append(dni_input)
+        if len(dni_input) == 11: numeros_a_probar.append(dni_input[2:10])
+
+        en_indice = False
+        if self.indice is not None and self.indice.listo:
+            # El documento se resuelve contra el snapshot local; a ARIA sólo vamos por el cupo fresco
+            for n in numeros_a_probar:
+                for c in self.indice.buscar(n):
+                    plan.append(("indice", "consultar_id", c['cliente_id'], _con_id(f"✅ Doc {n}")))
+                    en_indice = True
+
+        # Las búsquedas remotas por documento sólo si el índice no lo conoce (cliente más nuevo que el snapshot)
+        for n in ([] if en_indice else numeros_a_probar):
+            plan.append(("doc", "consultar", {'ident': n}, _por_documento(n, f"✅ Doc {n}")))
+            plan.append(("doc_q", "consultar", {'q': n}, _por_documento(n, f"✅ Doc Q {n}")))
+
+        partes = str(nombre_tn or "").replace(",","").split()
+        if partes and len(partes[-1]) > 3:
+            plan.append(("apellido", "consultar", {'q': partes[-1]}, _por_apellido(nombre_tn, numeros_a_probar)))
+        return plan
+
+    async def buscar_cliente_cascada_async(self, nombre_tn, dni_tn, nota_tn, consultas=None, especular=True, previo=None):
+        """
+        Busca al cliente de un pedido: IDs en la nota, luego documento (índice local, o ident y q), luego apellido.
+        `consultas` permite compartir las consultas entre pedidos de un mismo lote.
+        `previo` es (cliente_id, mensaje) de una resolución anterior con los mismos datos: se confirma antes, solo,
+        con una consulta por ID (que trae cupo y atraso frescos) y sólo si ya no existe se corre la cascada.
+        Si no aparece y alguna consulta falló, el mensaje es NO_RESPONDE (no NO_ENCONTRADO).
+
+        Con `especular`, todas las consultas salen a la vez y gana
+        el primer paso del plan que encuentra al cliente, esperando sólo a los anteriores: demora ~ la
+        consulta más lenta que haga falta, no la suma. El precio es que salen todas: el pool de ARIA tiene
+        lugar para el plan entero, así que cancelar al decidir casi nunca evita una consulta (un pedido
+        hace ~2x las consultas de la versión secuencial). Sin `especular` van de a una.
+        """
+        consultas = consultas or self
+        sondear = lambda paso, consulta, arg: self.transporte.en_pool(_sondear, paso, getattr(consultas, consulta), arg)
+        with METRICAS.medir("cascada", modo="especulativa" if especular else "secuencial") as medicion:
+            encontrado, fallida = None, False
+            if previo is not None:
+                paso, consulta, arg, evaluar = _paso_previo(previo)
+                res = await sondear(paso, consulta, arg)
+                encontrado, fallida = evaluar(res), res is CONSULTA_FALLIDA
+            if encontrado is None:
+                plan = self.plan_cascada(nombre_tn, dni_tn, nota_tn)
+                sondeos = (sondear(paso, consulta, arg) for paso, consulta, arg, _ in plan)
+                tareas = [asyncio.ensure_future(s) for s in sondeos] if especular else sondeos
+                try:
+                    for tarea, (_, _, _, evaluar) in zip(tareas, plan):
+                        res = await tarea
+                        encontrado = evaluar(res)
+                        if encontrado: break
+                        fallida = fallida or res is CONSULTA_FALLIDA
+                finally:
+                    if especular:
+                        for tarea in tareas: tarea.cancel()
+                    else:
+                        sondeos.close()
+            cli, msg = encontrado or (None, NO_RESPONDE if fallida else NO_ENCONTRADO)
+            medicion['metodo'] = metodo_de(msg)
+        return cli, msg
+
+    async def analizar_lote_async(self, solicitudes, concurrencia=8, especular=False, previos={}):
+        """
+        Corre la cascada para muchos pedidos, hasta `concurrencia` a la vez.
+        `solicitudes` es {clave: (nombre, dni, nota)}; genera (clave, cliente, mensaje) a medida que terminan.
+        `previos` es {clave: (cliente_id, mensaje)} con lo ya resuelto (ver buscar_cliente_cascada_async).
+        En lote no se especula por defecto: los pedidos ya ocupan todas las conexiones con ARIA y
+        las consultas de más sólo harían cola (duplican los pedidos a ARIA sin bajar el tiempo total).
+        """
+        consultas = ConsultasCompartidas(self)
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def una(clave, args):
+            async with semaforo:
+                return (clave, *await self.buscar_cliente_cascada_async(*args, consultas=consultas, especular=especular,
+                                                                        previo=previos.get(clave)))
+
+        tareas = [asyncio.ensure_future(una(clave, args)) for clave, args in solicitudes.items()]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                yield await siguiente
+        finally:
+            for tarea in tareas: tarea.cancel()  # Si el que itera se va antes, el resto del lote no sigue contra ARIA
+
+
+class ConsultasCompartidas:
+    """
+    Envuelve un ClienteAria para que cada consulta idéntica se haga una sola vez:
+    el resto de los pedidos del lote espera (o reutiliza) ese mismo resultado.
+    """
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self._futuros = {}
+        self._lock = threading.Lock()
+
+    def _una_vez(self, clave, funcion, arg):
+        with self._lock:
+            fut = self._futuros.get(clave)
+            propia = fut is None
+            if propia: fut = self._futuros[clave] = Future()
+        if propia:
+            try: fut.set_result(funcion(arg))
+            except BaseException as e:
+                fut.set_exception(e)  # Los que esperan la misma consulta reciben el error, no quedan colgados
+                raise
+        return fut.result()
+
+    def consultar_id(self, cliente_id):
+        return self._una_vez(("id", str(cliente_id)), self.cliente.consultar_id, cliente_id)
+
+    def consultar(self, params):
+        return self._una_vez(("clientes", _clave_params(params)), self.cliente.consultar, params)
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark del clasificador de perfiles.
+
+Compara el recorrido original (substring por keyword, primer match gana) con el
+clasificador indexado, sobre pedidos sintéticos, y mide cuánto cuesta sumar
+keywords. Correr desde la raíz del repo:
+
+    python -m benchmarks.bench_clasificador [--pedidos 10000]
+"""
+import argparse
+import random
+import time
+
+from perfiles import PERFILES_INTERES, ClasificadorPerfiles
+
+PALABRAS_RELLENO = ["negro", "blanco", "pro", "max", "128gb", "inalambrico", "usb", "original", "kit", "pack", "2024", "premium"]
+
+
+def clasificar_original(nombre, perfiles=PERFILES_INTERES):
+    """La detección de perfil tal como estaba en generar_recomendaciones (referencia)."""
+    nombre_lower = str(nombre).lower()
+    for perfil, datos in perfiles.items():
+        for kw in datos['keywords']:
+            if kw in nombre_lower: return perfil
+    return "HOGAR"
+
+
+def pedidos_sinteticos(cantidad, perfiles, semilla=7):
+    rnd = random.Random(semilla)
+    keywords = [kw for datos in perfiles.values() for kw in datos['keywords']]
+    pedidos = []
+    for _ in range(cantidad):
+        productos = []
+        for _ in range(rnd.randint(1, 3)):
+            palabras = rnd.sample(PALABRAS_RELLENO, 3) + [rnd.choice(keywords)]
+            rnd.shuffle(palabras)
+            productos.append(" ".join(palabras).title())
+        pedidos.append(productos)
+    return pedidos
+
+
+def perfiles_inflados(factor):
+    """Copia de PERFILES_INTERES con `factor` veces más keywords (inventadas) por perfil."""
+    inflados = {}
+    for perfil, datos in PERFILES_INTERES.items():
+        extra = [f"{kw}{i}" for i in range(1, factor) for kw in datos['keywords']]
+        inflados[perfil] = {**datos, 'keywords': datos['keywords'] + extra}
+    return inflados
+
+
+def medir(funcion, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pedidos", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'keywords':>9} {'variante':<22} {'total (ms)':>11} {'por pedido (us)':>16}")
+    for factor in (1, 10, 50):
+        perfiles = perfiles_inflados(factor)
+        pedidos = pedidos_sinteticos(args.pedidos, perfiles)
+        n_kw = sum(len(d['keywords']) for d in perfiles.values())
+
+        t_compilar = medir(lambda: ClasificadorPerfiles(perfiles))
+        clasificador = ClasificadorPerfiles(perfiles)
+        variantes = {
+            "original (1er prod.)": lambda: [clasificar_original(p[0], perfiles) for p in pedidos],
+            "índice (pedido entero)": lambda: clasificador.clasificar_lote(pedidos),
+        }
+        for nombre, funcion in variantes.items():
+            t = medir(funcion)
+            print(f"{n_kw:>9} {nombre:<22} {t * 1e3:>11.1f} {t / len(pedidos) * 1e6:>16.2f}")
+        print(f"{n_kw:>9} {'armar índice':<22} {t_compilar * 1e3:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
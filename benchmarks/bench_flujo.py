@@ -0,0 +1,245 @@
+"""
+Benchmark del flujo completo contra servidores falsos de Tiendanube, ARIA y SMTP.
+
+Levanta los falsos (benchmarks/servidores.py) con datos sintéticos y corre el
+Motor de la app (motor.py) contra ellos a 100, 1.000 y 10.000 pedidos: sincronización y
+listado de un estado, bandejas del almacén, cascada de ARIA (en lote; y de a un pedido,
+secuencial y con las consultas en vuelo a la vez), recomendaciones,
+armado y encolado de mails y despacho SMTP. Las etapas llaman a los mismos métodos que la
+app y el CLI, así que una regresión en ese camino se ve acá. Por etapa informa throughput,
+percentiles de latencia y pedidos a cada upstream (con 429 y 5xx aparte).
+Correr desde la raíz del repo:
+
+    python -m benchmarks.bench_flujo [--escalas 100,1000,10000] [--latencia 0.005] [--tasa-error 0.01] [--tasa-429 0.02]
+
+Por defecto los clientes no usan sus token buckets (los falsos no tienen cupo), así se
+mide el código y no la política de rate limit; --con-limites los deja como en producción
+y --cupo-tn pone el cupo de Tiendanube del lado del servidor.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from almacen import Pedido
+from metricas import METRICAS, percentil
+from motor import Motor
+from plantillas import ESCENARIO_APROBADO
+
+from benchmarks.servidores import AriaFalsa, Comportamiento, SumideroSMTP, TiendanubeFalsa
+from benchmarks.sinteticos import clientes_aria, pedidos_tn, productos_catalogo
+
+BANDEJAS = ("nuevos", "pendientes", "aprobados", "cancelados")
+
+
+def cronometrar(operaciones, hilos):
+    """Corre cada operación (un callable) en un pool y devuelve la latencia de cada una."""
+    def una(op):
+        t0 = time.perf_counter()
+        op()
+        return time.perf_counter() - t0
+    if hilos <= 1: return [una(op) for op in operaciones]
+    with ThreadPoolExecutor(max_workers=hilos) as ex:
+        return list(ex.map(una, operaciones))
+
+
+def latencias_metricas(marca, metrica, **filtro):
+    """Latencias que registró el código bajo prueba (p. ej. cada página de /orders) desde una marca."""
+    return [seg for _, _, nombre, etiquetas, seg, _ in METRICAS.eventos(marca)
+            if nombre == metrica and seg is not None and all(dict(etiquetas).get(k) == v for k, v in filtro.items())]
+
+
+class Banco:
+    def __init__(self, escala, args, directorio):
+        self.escala = escala
+        self.args = args
+        clientes = clientes_aria(max(50, escala // 2))  # Hay clientes con más de un pedido, como en la tienda
+        self.pedidos = pedidos_tn(clientes, escala)
+        http = dict(latencia=args.latencia, jitter=0.2, tasa_error=args.tasa_error, tasa_429=args.tasa_429)
+        self.tn = TiendanubeFalsa(self.pedidos, productos_catalogo(), Comportamiento(**http, cupo=(40, 2.0) if args.cupo_tn else None)).iniciar()
+        self.aria = AriaFalsa(clientes, Comportamiento(**http)).iniciar()
+        self.smtp = SumideroSMTP(Comportamiento(latencia=args.latencia_smtp, tasa_error=args.tasa_error)).iniciar()
+        self.servidores = (self.tn, self.aria, self.smtp)
+
+        self.motor = Motor({
+            "TN_ID": "1", "TN_TOKEN": "token", "TN_URL_BASE": self.tn.url, "ARIA_KEY": "clave", "ARIA_URL_BASE": self.aria.url,
+            "DB_PATH": os.path.join(directorio, f"bench_{escala}.sqlite3"),
+            "email": {"smtp_server": "127.0.0.1", "smtp_port": self.smtp.puerto, "smtp_user": "bench@example.com",
+                      "smtp_password": "clave", "smtp_tls": False},
+        })
+        self.cliente_aria = self.motor.cliente_aria
+        if not args.con_limites:
+            self.motor.transporte_tn.limitador = None
+            self.cliente_aria.transporte.limitador = None
+        self.almacen = self.motor.almacen
+        self.sincronizador = self.motor.sincronizador
+        self.bandeja = self.motor.bandeja_salida(iniciar=False)
+        self.bandeja.espera_base = 0  # Los reintentos SMTP vencen enseguida: la etapa de envío no espera de más
+
+    def detener(self):
+        for s in self.servidores: s.detener()
+
+    def etapa(self, nombre, funcion):
+        """Corre una etapa; `funcion(marca)` devuelve (unidades procesadas, latencias en segundos)."""
+        for s in self.servidores: s.contador.limpiar()
+        METRICAS.limpiar()
+        marca = METRICAS.marca()
+        t0 = time.perf_counter()
+        unidades, latencias = funcion(marca)
+        total = time.perf_counter() - t0
+        ordenadas = sorted(latencias)
+        fila = {'escala': self.escala, 'etapa': nombre, 'unidades': unidades, 'segundos': round(total, 4),
+                'por_segundo': round(unidades / total, 1) if total > 0 else None,
+                'p50_ms': round(percentil(ordenadas, 0.5) * 1000, 2), 'p95_ms': round(percentil(ordenadas, 0.95) * 1000, 2),
+                'p99_ms': round(percentil(ordenadas, 0.99) * 1000, 2)}
+        for s in self.servidores:
+            conteo = s.contador.conteo()
+            fila[f'{s.nombre}_pedidos'] = sum(conteo.values())
+            fila[f'{s.nombre}_429'] = sum(n for (_, status), n in conteo.items() if status == 429)
+            fila[f'{s.nombre}_errores'] = sum(n for (_, status), n in conteo.items() if status >= 500 or status == 451)
+        return fila
+
+    # --- Etapas ---
+
+    def sincronizar(self, marca):
+        n = self.motor.sincronizar()
+        return n, latencias_metricas(marca, "http", upstream="tiendanube", endpoint="/orders")
+
+    def listar_abiertos(self, marca):
+        n = len(self.motor.bucle.correr(self.sincronizador.traer_todos_async({'status': 'open'})))
+        return n, latencias_metricas(marca, "http", upstream="tiendanube", endpoint="/orders")
+
+    def sincronizar_delta(self, marca):
+        # Cambia el 1% de los pedidos del lado de la tienda y trae sólo eso
+        rnd = random.Random(1)
+        for p in rnd.sample(self.pedidos, max(1, len(self.pedidos) // 100)):
+            p['owner_note'] = f"{p['owner_note']} visto".strip()
+            p['updated_at'] = "2099-01-01T00:00:00+0000"
+        n = self.motor.sincronizar()
+        return n, latencias_metricas(marca, "http", upstream="tiendanube", endpoint="/orders")
+
+    def bandejas_paginadas(self, marca):
+        ops = []
+        for nombre in BANDEJAS:
+            paginas = max(1, -(-self.almacen.contar(nombre) // 25))
+            for pagina in range(min(paginas, 20)):
+                ops.append(lambda nombre=nombre, pagina=pagina: (self.almacen.contar(nombre), self.almacen.bandeja(nombre, 25, pagina * 25)))
+        return len(ops), cronometrar(ops, 1)
+
+    def bandejas_completas(self, marca):
+        ops = [lambda nombre=nombre: self.almacen.bandeja(nombre) for nombre in BANDEJAS]
+        return len(ops), cronometrar(ops, 1)
+
+    def muestra_cascada(self, tope=None):
+        """{pedido_id: (nombre, documento, nota)} como los arma la app; cada etapa arranca con el cache frío."""
+        self.cliente_aria.cache.limpiar()
+        n = self.args.muestra_cascada or len(self.pedidos)
+        return {p['id']: (p['customer']['name'], p['customer']['identification'], p['owner_note']) for p in self.pedidos[:min(n, tope or n)]}
+
+    def cascada(self, marca):
+        # El "Analizar página" de la app y el triage del CLI: Motor.analizar_lote sobre el event loop, con memo;
+        # la latencia de cada pedido sale de la métrica de la cascada
+        muestra = self.muestra_cascada()
+        for _ in self.motor.analizar_lote(muestra, hilos=self.args.hilos): pass
+        return len(muestra), latencias_metricas(marca, "cascada")
+
+    def cascada_de_a_uno(self, marca):
+        # Referencia: una cascada sola, con las consultas de a una (sin especular)
+        cascada = lambda args: self.motor.bucle.correr(self.cliente_aria.buscar_cliente_cascada_async(*args, especular=False))
+        ops = [lambda args=args: cascada(args) for args in self.muestra_cascada(200).values()]
+        return len(ops), cronometrar(ops, 1)
+
+    def cascada_especulativa(self, marca):
+        # El botón "Analizar" de la app: Motor.buscar_cliente (consultas en vuelo a la vez, memo por pedido)
+        muestra = self.muestra_cascada(200)
+        for pid in muestra: self.almacen.olvidar_resolucion(pid)  # Sin memo del lote anterior: cascada completa
+        ops = [lambda pid=pid, args=args: self.motor.buscar_cliente(*args, pedido_id=pid) for pid, args in muestra.items()]
+        return len(ops), cronometrar(ops, 1)
+
+    def calentar_catalogo(self, marca):
+        # El catálogo del Motor se calienta solo al crearse, sobre el loop; la etapa espera a que termine
+        catalogo = self.motor.catalogo
+        catalogo.calentado.wait()
+        return len(catalogo.items()), latencias_metricas(marca, "http", upstream="tiendanube", endpoint="/products")
+
+    def recomendaciones(self, marca):
+        ops = [lambda p=p: self.motor.recomendaciones([i['name'] for i in p['products']]) for p in self.pedidos]
+        return len(ops), cronometrar(ops, 1)
+
+    def notificaciones(self, marca):
+        # Motor.notificar (lo que usan la app y el triage): armar el mail, encolarlo y contarlo en la analítica
+        def notificar(p):
+            pedido = Pedido.desde_tn(p)
+            datos = {'id_visual': pedido.id_visual, 'nombres_productos': pedido.nombres_productos}
+            self.motor.notificar(pedido.cliente_email, pedido.cliente_nombre, ESCENARIO_APROBADO, datos, iniciar_envio=False)
+        return len(self.pedidos), cronometrar([lambda p=p: notificar(p) for p in self.pedidos], 1)
+
+    def envio(self, marca):
+        server = None
+        while self.bandeja.estadisticas().get('pendiente'):
+            server = self.bandeja.despachar(server)
+        if server is not None: self.bandeja._cerrar(server)
+        return self.bandeja.estadisticas().get('enviado', 0), latencias_metricas(marca, "smtp", operacion="enviar")
+
+    def correr(self):
+        etapas = [
+            ("sincronizar (completa)", self.sincronizar),
+            ("listado (open)", self.listar_abiertos),
+            ("sincronizar (delta 1%)", self.sincronizar_delta),
+            ("bandejas (página de 25)", self.bandejas_paginadas),
+            ("bandejas (completas)", self.bandejas_completas),
+            ("cascada ARIA", self.cascada),
+            ("cascada 1 pedido", self.cascada_de_a_uno),
+            ("cascada 1 ped. (especul.)", self.cascada_especulativa),
+            ("catálogo (calentar)", self.calentar_catalogo),
+            ("recomendaciones", self.recomendaciones),
+            ("armar + encolar mail", self.notificaciones),
+            ("envío SMTP", self.envio),
+        ]
+        return [self.etapa(nombre, funcion) for nombre, funcion in etapas]
+
+
+COLUMNAS = (("etapa", "<26"), ("unidades", ">8"), ("segundos", ">9"), ("por_segundo", ">10"), ("p50_ms", ">8"), ("p95_ms", ">8"),
+            ("p99_ms", ">8"), ("tiendanube_pedidos", ">6"), ("aria_pedidos", ">6"), ("smtp_pedidos", ">6"))
+TITULOS = {"por_segundo": "u/s", "tiendanube_pedidos": "TN", "aria_pedidos": "ARIA", "smtp_pedidos": "SMTP"}
+
+
+def imprimir(filas):
+    print(" ".join(f"{TITULOS.get(c, c):{f}}" for c, f in COLUMNAS) + "  429/errores")
+    for fila in filas:
+        fallas = " ".join(f"{s}:{fila[f'{s}_429']}/{fila[f'{s}_errores']}" for s in ("tiendanube", "aria", "smtp")
+                          if fila[f'{s}_429'] or fila[f'{s}_errores'])
+        print(" ".join(f"{'' if fila[c] is None else fila[c]:{f}}" for c, f in COLUMNAS) + f"  {fallas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", default="100,1000,10000", help="cantidades de pedidos, separadas por coma")
+    parser.add_argument("--latencia", type=float, default=0.005, help="segundos por respuesta de TN y ARIA")
+    parser.add_argument("--latencia-smtp", type=float, default=0.001)
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="fracción de 5xx (451 en SMTP)")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="fracción de 429 al azar en TN y ARIA")
+    parser.add_argument("--cupo-tn", action="store_true", help="el falso de TN aplica el cupo real (40, 2/s) y responde 429")
+    parser.add_argument("--con-limites", action="store_true", help="dejar los token buckets de los clientes como en producción")
+    parser.add_argument("--muestra-cascada", type=int, default=0, help="pedidos a analizar por escala (0 = todos)")
+    parser.add_argument("--hilos", type=int, default=8, help="cascadas a la vez, como Motor.analizar_lote")
+    parser.add_argument("--json", action="store_true", help="una línea JSON por etapa en vez de la tabla")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for escala in (int(e) for e in args.escalas.split(",")):
+            banco = Banco(escala, args, directorio)
+            try: filas = banco.correr()
+            finally: banco.detener()
+            if args.json:
+                for fila in filas: print(json.dumps(fila))
+            else:
+                print(f"\n== {escala} pedidos ==")
+                imprimir(filas)
+
+
+if __name__ == "__main__":
+    main()
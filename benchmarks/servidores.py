@@ -0,0 +1,311 @@
+"""
+Servidores falsos de Tiendanube, ARIA y SMTP para los benchmarks.
+
+Corren en hilos dentro del mismo proceso, sobre 127.0.0.1 y un puerto libre.
+Cada uno tiene un `Comportamiento` configurable (latencia, tasa de errores
+5xx, tasa de 429 y un cupo tipo token bucket que también responde 429) y
+cuenta los pedidos que recibe por endpoint y status.
+"""
+import base64
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from indice_documentos import documentos_de
+from transporte import endpoint_de
+
+
+class Comportamiento:
+    def __init__(self, latencia=0.0, jitter=0.0, tasa_error=0.0, tasa_429=0.0, espera_429=0.05, cupo=None):
+        self.latencia = latencia  # Segundos por respuesta
+        self.jitter = jitter  # +/- fracción de la latencia
+        self.tasa_error = tasa_error  # Fracción de respuestas 500 (o 451 en SMTP)
+        self.tasa_429 = tasa_429  # Fracción de 429 al azar
+        self.espera_429 = espera_429  # Lo que pide esperar un 429, en segundos
+        self.cupo = cupo  # (capacidad, ritmo por segundo): token bucket del lado del servidor
+        self._tokens = float(self.cupo[0]) if self.cupo else 0.0
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+        self._rnd = random.Random(11)
+
+    def demorar(self):
+        if self.latencia > 0:
+            with self._lock: factor = 1 + self._rnd.uniform(-self.jitter, self.jitter)
+            time.sleep(self.latencia * factor)
+
+    def decidir(self):
+        """None si el pedido pasa; 429 o 500 si hay que rechazarlo. También devuelve lo que queda de cupo."""
+        with self._lock:
+            restantes = None
+            if self.cupo:
+                ahora = time.monotonic()
+                self._tokens = min(self.cupo[0], self._tokens + (ahora - self._ultimo) * self.cupo[1])
+                self._ultimo = ahora
+                if self._tokens < 1: return 429, 0
+                self._tokens -= 1
+                restantes = int(self._tokens)
+            if self._rnd.random() < self.tasa_429: return 429, restantes
+            if self._rnd.random() < self.tasa_error: return 500, restantes
+            return None, restantes
+
+
+class Contador:
+    def __init__(self):
+        self._conteo = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, endpoint, status):
+        with self._lock: self._conteo[(endpoint, status)] = self._conteo.get((endpoint, status), 0) + 1
+
+    def conteo(self):
+        with self._lock: return dict(self._conteo)
+
+    def total(self):
+        return sum(self.conteo().values())
+
+    def limpiar(self):
+        with self._lock: self._conteo.clear()
+
+
+class ServidorHTTPFalso:
+    """Base de los falsos HTTP: subclases implementan responder(metodo, ruta, params, cuerpo) -> (status, json, headers)."""
+
+    nombre = "http"
+
+    def __init__(self, comportamiento=None):
+        self.comportamiento = comportamiento or Comportamiento()
+        self.contador = Contador()
+        falso = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+            wbufsize = -1  # Headers y cuerpo en un solo envío; si no, el delayed ACK suma ~40 ms por respuesta
+            disable_nagle_algorithm = True
+
+            def _atender(self, metodo):
+                url = urllib.parse.urlsplit(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                largo = int(self.headers.get("Content-Length") or 0)
+                cuerpo = json.loads(self.rfile.read(largo)) if largo else None
+                falso.comportamiento.demorar()
+                rechazo, restantes = falso.comportamiento.decidir()
+                if rechazo is None: status, datos, headers = falso.responder(metodo, url.path, params, cuerpo)
+                else: status, datos, headers = rechazo, {"error": "falso"}, falso.headers_429() if rechazo == 429 else {}
+                if restantes is not None and falso.comportamiento.cupo:
+                    headers = {**headers, **falso.headers_cupo(restantes)}
+                falso.contador.sumar(endpoint_de(url.path), status)
+                crudo = json.dumps(datos).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(crudo)))
+                for k, v in headers.items(): self.send_header(k, str(v))
+                self.end_headers()
+                self.wfile.write(crudo)
+
+            def do_GET(self): self._atender("GET")
+            def do_PUT(self): self._atender("PUT")
+            def do_POST(self): self._atender("POST")
+
+            def log_message(self, formato, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.servidor.daemon_threads = True
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, name=f"falso-{self.nombre}", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_port}"
+
+    def headers_429(self):
+        return {"Retry-After": self.comportamiento.espera_429}
+
+    def headers_cupo(self, restantes):
+        return {"x-ratelimit-limit": self.comportamiento.cupo[0], "x-ratelimit-remaining": restantes}
+
+    def responder(self, metodo, ruta, params, cuerpo):
+        raise NotImplementedError
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class TiendanubeFalsa(ServidorHTTPFalso):
+    """
+    /{tienda}/orders (status, updated_at_min, page, per_page, fields; X-Total-Count y 404 en página vacía),
+    /{tienda}/orders/{id} (GET, PUT), /{tienda}/orders/{id}/cancel y /{tienda}/products (handle, q).
+    """
+
+    nombre = "tiendanube"
+
+    def __init__(self, pedidos, productos, comportamiento=None):
+        super().__init__(comportamiento)
+        self.pedidos = {p['id']: p for p in pedidos}
+        self._orden = sorted(self.pedidos, reverse=True)
+        self.productos = productos
+        self._por_handle = {p['handle']['es']: p for p in productos}
+        self._lock = threading.Lock()
+
+    def headers_429(self):
+        return {"x-rate-limit-reset": int(self.comportamiento.espera_429 * 1000)}
+
+    def headers_cupo(self, restantes):
+        return {"x-rate-limit-limit": self.comportamiento.cupo[0], "x-rate-limit-remaining": restantes}
+
+    def responder(self, metodo, ruta, params, cuerpo):
+        partes = ruta.strip("/").split("/")[1:]  # Sin el id de tienda
+        if partes == ["orders"] and metodo == "GET": return self._listar(params)
+        if partes == ["products"] and metodo == "GET": return self._productos(params)
+        if len(partes) >= 2 and partes[0] == "orders" and partes[1].isdigit():
+            with self._lock:
+                pedido = self.pedidos.get(int(partes[1]))
+                if pedido is None: return 404, {"description": "Not Found"}, {}
+                if metodo == "GET": return 200, self._campos(pedido, params), {}
+                if metodo == "PUT": pedido.update(cuerpo or {})
+                elif partes[2:] == ["cancel"]: pedido['status'] = "cancelled"
+                pedido['updated_at'] = time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime())
+                return 200, pedido, {}
+        return 404, {"description": "Not Found"}, {}
+
+    @staticmethod
+    def _campos(pedido, params):
+        if not params.get('fields'): return pedido
+        return {k: pedido[k] for k in params['fields'].split(",") if k in pedido}
+
+    def _listar(self, params):
+        estado = params.get('status', 'open')
+        desde = params.get('updated_at_min')
+        with self._lock:
+            filtrados = [p for p in (self.pedidos[i] for i in self._orden)
+                         if (estado == "any" or p['status'] == estado) and (desde is None or p['updated_at'] >= desde)]
+        por_pagina = int(params.get('per_page', 30))
+        pagina = int(params.get('page', 1))
+        lote = filtrados[(pagina - 1) * por_pagina: pagina * por_pagina]
+        if not lote: return 404, {"description": "Last page is 0"}, {}
+        return 200, [self._campos(p, params) for p in lote], {"X-Total-Count": len(filtrados)}
+
+    def _productos(self, params):
+        if 'handle' in params:
+            p = self._por_handle.get(params['handle'])
+            return 200, [p] if p else [], {}
+        palabras = params.get('q', '').lower().split()
+        encontrados = [p for h, p in self._por_handle.items() if all(w in h for w in palabras)]
+        return 200, encontrados[:int(params.get('per_page', 30))], {}
+
+
+class AriaFalsa(ServidorHTTPFalso):
+    """/cliente/{id} y /clientes (ident, q, page, per_page) con la forma {data, last_page}."""
+
+    nombre = "aria"
+
+    def __init__(self, clientes, comportamiento=None):
+        super().__init__(comportamiento)
+        self.clientes = {str(c['cliente_id']): c for c in clientes}
+        self._lista = list(self.clientes.values())
+        self._por_doc = {}
+        self._por_palabra = {}
+        for c in self._lista:
+            for doc in documentos_de(c): self._por_doc.setdefault(doc, []).append(c)
+            for palabra in f"{c['cliente_nombre']} {c['cliente_apellido']}".lower().split():
+                self._por_palabra.setdefault(palabra, []).append(c)
+
+    def responder(self, metodo, ruta, params, cuerpo):
+        m = re.fullmatch(r"/cliente/(\d+)", ruta)
+        if m:
+            c = self.clientes.get(m.group(1))
+            return (200, c, {}) if c else (404, {"message": "no encontrado"}, {})
+        if ruta != "/clientes": return 404, {}, {}
+        if 'ident' in params:
+            n = re.sub(r"\D", "", params['ident'])
+            return 200, {"data": self._por_doc.get(n, []) or self._por_doc.get(n[2:10], []), "last_page": 1}, {}
+        if 'q' in params:
+            q = params['q'].strip().lower()
+            datos = self._por_doc.get(re.sub(r"\D", "", q), []) if q.isdigit() else self._por_palabra.get(q, [])
+            return 200, {"data": datos[:50], "last_page": 1}, {}
+        por_pagina = int(params.get('per_page', 50))
+        pagina = int(params.get('page', 1))
+        ultima = max(1, -(-len(self._lista) // por_pagina))
+        return 200, {"data": self._lista[(pagina - 1) * por_pagina: pagina * por_pagina], "last_page": ultima}, {}
+
+
+class SumideroSMTP:
+    """
+    SMTP mínimo que acepta todo y descarta (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, NOOP, RSET, QUIT).
+    Sin TLS: la bandeja tiene que usarse con tls=False. `tasa_error` responde 451 al DATA.
+    """
+
+    nombre = "smtp"
+
+    def __init__(self, comportamiento=None):
+        self.comportamiento = comportamiento or Comportamiento()
+        self.contador = Contador()
+        self.recibidos = 0
+        falso = self
+
+        class Manejador(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def _decir(self, linea):
+                self.wfile.write(linea.encode() + b"\r\n")
+
+            def handle(self):
+                self._decir("220 sumidero ESMTP")
+                while True:
+                    linea = self.rfile.readline()
+                    if not linea: return
+                    comando = linea.decode(errors="replace").strip()
+                    verbo = comando.split(" ", 1)[0].upper()
+                    if verbo != "DATA": falso.contador.sumar(verbo, 250)
+                    if verbo == "EHLO":
+                        self._decir("250-sumidero")
+                        self._decir("250 AUTH PLAIN LOGIN")
+                    elif verbo == "AUTH":
+                        if comando.upper().startswith("AUTH LOGIN"):
+                            self._decir("334 " + base64.b64encode(b"Username:").decode()); self.rfile.readline()
+                            self._decir("334 " + base64.b64encode(b"Password:").decode()); self.rfile.readline()
+                        self._decir("235 ok")
+                    elif verbo == "DATA":
+                        self._decir("354 seguir")
+                        while self.rfile.readline() not in (b".\r\n", b".\n", b""): pass
+                        falso.comportamiento.demorar()
+                        if falso.comportamiento.decidir()[0] is not None:
+                            falso.contador.sumar("DATA", 451)
+                            self._decir("451 error temporal")
+                        else:
+                            falso.contador.sumar("DATA", 250)
+                            falso.recibidos += 1
+                            self._decir("250 encolado")
+                    elif verbo == "QUIT":
+                        self._decir("221 chau")
+                        return
+                    else:
+                        self._decir("250 ok")
+
+        class Servidor(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.servidor = Servidor(("127.0.0.1", 0), Manejador)
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, name="falso-smtp", daemon=True)
+
+    @property
+    def puerto(self):
+        return self.servidor.server_address[1]
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
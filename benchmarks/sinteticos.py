@@ -0,0 +1,129 @@
+"""
+Datos sintéticos para los benchmarks: pedidos de Tiendanube, clientes de ARIA
+y productos del catálogo de cross-selling, con una mezcla parecida a la real.
+
+Cada pedido apunta a un cliente de ARIA por alguno de los caminos de la
+cascada (ID en la nota, DNI, CUIT, sólo apellido) o a ninguno, para que la
+cascada recorra todos sus pasos. Los pedidos traen también el resto de lo que
+manda Tiendanube (direcciones, envío, pago, productos completos), que la app no usa.
+"""
+import random
+
+from catalogo import handle_desde_link
+from perfiles import PERFILES_INTERES
+
+NOMBRES = ["Juan", "María", "Carlos", "Lucía", "Pedro", "Sofía", "Diego", "Valentina", "Jorge", "Camila", "Martín", "Florencia"]
+APELLIDOS = ["González", "Rodríguez", "Gómez", "Fernández", "López", "Díaz", "Martínez", "Pérez", "García", "Sánchez",
+             "Romero", "Sosa", "Álvarez", "Torres", "Ruiz", "Ramírez", "Flores", "Benítez", "Acosta", "Medina"]
+RELLENO = ["negro", "blanco", "pro", "max", "128gb", "inalambrico", "usb", "original", "kit", "premium"]
+
+# Cómo se puede encontrar al cliente de cada pedido, con su peso
+CAMINOS = (("nota", 0.2), ("dni", 0.35), ("cuit", 0.2), ("apellido", 0.1), ("ninguno", 0.15))
+
+
+def clientes_aria(cantidad, semilla=3):
+    rnd = random.Random(semilla)
+    clientes = []
+    for i in range(cantidad):
+        dni = str(20_000_000 + i * 7)
+        cuit = rnd.choice(("20", "27")) + dni + str(rnd.randint(0, 9))
+        clientes.append({
+            'cliente_id': 1000 + i,
+            'cliente_nombre': rnd.choice(NOMBRES),
+            'cliente_apellido': f"{rnd.choice(APELLIDOS)}{i}",  # Apellido único: la búsqueda por apellido tiene un solo candidato
+            'cliente_dnicuit': cuit if rnd.random() < 0.5 else dni,
+            'clienteScoringFinanciable': rnd.choice((0, 50_000, 150_000, 400_000, 1_000_000)),
+            'cliente_meses_atraso': 0 if rnd.random() < 0.85 else rnd.randint(1, 6),
+        })
+    return clientes
+
+
+def nombre_producto(rnd):
+    perfil = rnd.choice(list(PERFILES_INTERES))
+    palabras = rnd.sample(RELLENO, 2) + [rnd.choice(PERFILES_INTERES[perfil]['keywords'])]
+    rnd.shuffle(palabras)
+    return " ".join(palabras).title()
+
+
+def direccion(rnd):
+    return {'address': f"Calle {rnd.randint(1, 300)}", 'number': str(rnd.randint(1, 9999)), 'floor': "", 'locality': "Centro",
+            'city': "Córdoba", 'province': "Córdoba", 'country': "AR", 'zipcode': str(rnd.randint(1000, 9999)),
+            'phone': f"+54351{rnd.randint(1_000_000, 9_999_999)}"}
+
+
+def producto_tn(rnd, n):
+    nombre = nombre_producto(rnd)
+    return {
+        'id': 80_000_000 + n, 'product_id': 7_000_000 + n % 500, 'variant_id': 6_000_000 + n % 900, 'name': nombre,
+        'price': str(rnd.randint(5, 400) * 1000), 'quantity': rnd.randint(1, 2), 'sku': f"SKU-{n % 900:05d}",
+        'barcode': None, 'free_shipping': False, 'weight': "0.500", 'width': "10.00", 'height': "10.00", 'depth': "10.00",
+        'variant_values': [], 'properties': [], 'issues': [],
+        'image': {'id': n, 'product_id': 7_000_000 + n % 500, 'src': f"https://example.com/producto/{n % 500}.jpg",
+                  'position': 1, 'alt': [], 'created_at': "2023-05-01T10:00:00+0000", 'updated_at': "2023-05-01T10:00:00+0000"},
+    }
+
+
+def relleno_tn(rnd, i, cliente):
+    """Lo que manda Tiendanube además de lo que usa la app."""
+    envio = direccion(rnd)
+    return {
+        'token': f"{rnd.getrandbits(128):032x}", 'store_id': 1, 'contact_email': cliente['email'], 'contact_name': cliente['name'],
+        'contact_phone': envio['phone'], 'contact_identification': cliente['identification'],
+        'subtotal': "0.00", 'discount': "0.00", 'discount_coupon': "0.00", 'discount_gateway': "0.00", 'coupon': [],
+        'promotional_discount': {'id': None, 'store_id': 1, 'order_id': i, 'total_discount_amount': "0.00", 'contents': []},
+        'currency': "ARS", 'language': "es", 'gateway': "offline", 'gateway_id': None, 'gateway_name': "Contrafactura",
+        'shipping': "api_1", 'shipping_option': "Envío a domicilio", 'shipping_option_code': "domicilio",
+        'shipping_cost_owner': "0.00", 'shipping_cost_customer': "0.00", 'shipping_min_days': 2, 'shipping_max_days': 5,
+        'shipping_tracking_number': None, 'shipping_status': "unpacked", 'shipping_address': envio,
+        **{f"billing_{k}": v for k, v in direccion(rnd).items()},
+        'payment_details': {'method': "custom", 'credit_card_company': None, 'installments': 1},
+        'client_details': {'browser_ip': f"190.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}",
+                           'user_agent': "Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36"},
+        'landing_url': "https://tienda.example.com/productos/", 'note': "", 'created_at': "2024-01-01T10:00:00+0000",
+        'completed_at': {'date': "2024-01-01 10:00:00.000000", 'timezone_type': 3, 'timezone': "UTC"}, 'next_action': "noop",
+    }
+
+
+def pedidos_tn(clientes, cantidad, semilla=5):
+    rnd = random.Random(semilla)
+    caminos, pesos = zip(*CAMINOS)
+    pedidos = []
+    for i in range(cantidad):
+        c = clientes[i % len(clientes)]
+        camino = rnd.choices(caminos, pesos)[0]
+        doc = "".join(ch for ch in str(c['cliente_dnicuit']) if ch.isdigit())
+        dni = doc[2:10] if len(doc) == 11 else doc
+        identificacion = {"dni": dni, "cuit": f"20{dni}1", "apellido": "", "nota": "", "ninguno": str(rnd.randint(1, 99999))}[camino]
+        nota = f"cliente {c['cliente_id']}" if camino == "nota" else ""
+        nombre = f"{c['cliente_nombre']} {c['cliente_apellido']}" if camino != "ninguno" else f"{rnd.choice(NOMBRES)} Desconocido"
+        estado = rnd.choices(("open", "closed", "cancelled"), (0.6, 0.3, 0.1))[0]
+        cliente = {'name': nombre, 'email': f"cliente{i}@example.com", 'identification': identificacion}
+        pedidos.append({
+            **relleno_tn(rnd, 500_000 + i, cliente),
+            'id': 500_000 + i,
+            'number': 10_000 + i,
+            'status': estado,
+            'payment_status': "paid" if estado == "closed" else "pending",
+            'owner_note': nota,
+            'total': str(rnd.choice((25_000, 80_000, 140_000, 300_000, 900_000))),
+            'updated_at': f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00+0000",
+            'customer': cliente,
+            'products': [producto_tn(rnd, i * 3 + n) for n in range(rnd.randint(1, 3))],
+        })
+    return pedidos
+
+
+def productos_catalogo(semilla=9):
+    """Un producto de Tiendanube por cada item de los perfiles, con el handle de su link."""
+    rnd = random.Random(semilla)
+    productos = []
+    for n, item in enumerate({item['link']: item for datos in PERFILES_INTERES.values() for item in datos['items']}.values()):
+        handle = handle_desde_link(item['link'])
+        productos.append({
+            'id': 9000 + n,
+            'handle': {'es': handle},
+            'name': {'es': handle.replace("-", " ").title()},
+            'price': str(rnd.randint(5, 200) * 1000),
+            'images': [{'src': f"https://example.com/{handle}.jpg"}],
+        })
+    return productos
@@ -0,0 +1,68 @@
+"""
+Event loop de I/O compartido.
+
+Un solo loop de asyncio corriendo en un hilo de fondo, por proceso. El código
+sincrónico (Streamlit, el CLI) le pasa corrutinas y espera el resultado; la
+sincronización, la cascada de ARIA y el refresco del catálogo corren todos
+sobre este mismo loop. Cada corrutina corre con los contextvars de quien la
+programó (p. ej. la corrida de métricas de un rerun).
+"""
+import asyncio
+import contextvars
+import queue
+import threading
+
+_FIN = object()
+
+
+async def _en_contexto(corrutina, contexto):
+    # La tarea nace con el contexto del hilo del loop: le pasamos el de quien la programó
+    for variable, valor in contexto.items(): variable.set(valor)
+    return await corrutina
+
+
+class Bucle:
+    def __init__(self, nombre="bucle-io"):
+        self.loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self.loop.run_forever, name=nombre, daemon=True)
+        self._hilo.start()
+
+    def programar(self, corrutina, heredar=True):
+        """
+        La lanza en el loop y devuelve un concurrent.futures.Future. Con `heredar`, corre con los contextvars
+        del que llama; lo que queda vivo de fondo (un refresco periódico) va sin heredar.
+        """
+        if heredar: corrutina = _en_contexto(corrutina, contextvars.copy_context())
+        return asyncio.run_coroutine_threadsafe(corrutina, self.loop)
+
+    def correr(self, corrutina, timeout=None):
+        """La corre y espera el resultado. No llamar desde el propio loop (se trabaría)."""
+        return self.programar(corrutina).result(timeout)
+
+    def iterar(self, generador):
+        """
+        Recorre un generador asíncrono desde código sincrónico, entregando cada valor apenas está.
+        Si el que consume deja de iterar (un rerun, una excepción, Ctrl-C), el generador se cancela en el loop.
+        """
+        cola = queue.Queue()
+
+        async def bombear():
+            try:
+                async for valor in generador: cola.put((valor, None))
+            except BaseException as e:
+                cola.put((_FIN, e))
+            else:
+                cola.put((_FIN, None))
+            finally:
+                await generador.aclose()
+
+        futuro = self.programar(bombear())
+        try:
+            while True:
+                valor, error = cola.get()
+                if valor is _FIN:
+                    if error is not None: raise error
+                    return
+                yield valor
+        finally:
+            futuro.cancel()
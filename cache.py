@@ -0,0 +1,70 @@
+"""
+Cache en memoria con TTL y desalojo LRU, segura entre hilos.
+
+Los resultados vacíos se guardan con su propio TTL (cache negativo), para no
+pagar una y otra vez el timeout de una consulta que sabemos que no trae nada.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    def __init__(self, max_items=2000, ttl=900, ttl_vacio=300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.ttl_vacio = ttl_vacio
+        self._datos = OrderedDict()  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+        self.hits = self.hits_vacios = self.misses = self.desalojos = 0
+
+    def obtener(self, clave):
+        """Devuelve (encontrado, valor). Un valor vencido cuenta como miss."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None: del self._datos[clave]
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            if entrada[1]: self.hits += 1
+            else: self.hits_vacios += 1
+            return True, entrada[1]
+
+    def guardar(self, clave, valor):
+        ttl = self.ttl if valor else self.ttl_vacio
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def obtener_o_calcular(self, clave, funcion):
+        encontrado, valor = self.obtener(clave)
+        if encontrado: return valor
+        valor = funcion()
+        self.guardar(clave, valor)
+        return valor
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def invalidar_si(self, predicado):
+        """Borra todas las entradas cuyo (clave, valor) cumple el predicado. Devuelve cuántas borró."""
+        with self._lock:
+            claves = [c for c, (_, v) in self._datos.items() if predicado(c, v)]
+            for c in claves: del self._datos[c]
+        return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'hits': self.hits, 'hits_vacios': self.hits_vacios, 'misses': self.misses,
+                'desalojos': self.desalojos, 'items': len(self._datos),
+            }
@@ -0,0 +1,138 @@
+"""
+Catálogo de productos para el cross-selling.
+
+Al arrancar resuelve en paralelo todos los items de los perfiles contra la API
+de productos de Tiendanube, buscando por handle exacto (el último tramo del
+link) en vez de por texto libre. Las entradas se refrescan en segundo plano
+antes de vencer y, mientras tanto, se sigue sirviendo el dato anterior: armar
+un mail nunca espera a una búsqueda de producto.
+
+El calentado y el refresco periódico corren como corrutinas sobre el event loop
+compartido (bucle.py) y el pool del transporte de Tiendanube, sin hilos propios.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import METRICAS
+
+
+FOTO_PLACEHOLDER = "https://via.placeholder.com/150?text=Ver+Web"
+
+
+def handle_desde_link(link):
+    return link.strip("/").split("/")[-1]
+
+
+def info_por_defecto(item_dict):
+    """Lo que mostramos mientras el producto no está resuelto (o si no existe en la tienda)."""
+    foto_manual = item_dict.get('foto', '')
+    return {
+        'nombre': "Producto Recomendado",
+        'precio': 0,
+        'foto': foto_manual if foto_manual else FOTO_PLACEHOLDER,
+        'url': item_dict.get('link', '#'),
+    }
+
+
+class CatalogoCrossSell:
+    def __init__(self, transporte, perfiles, ttl=3600, anticipo=0.8, hilos=6):
+        self.transporte = transporte
+        self.perfiles = perfiles
+        self.ttl = ttl
+        self.anticipo = anticipo  # Fracción del TTL a partir de la cual refrescamos
+        self._entradas = {}  # link -> (resuelto_en, info)
+        self._en_curso = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="catalogo")
+        self._mantenimiento = None  # Future de la corrutina que lo mantiene fresco
+        self.calentado = threading.Event()  # Se marca al terminar la primera pasada completa
+        self.version = 0  # Sube cada vez que cambia alguna entrada; sirve para invalidar lo armado con el catálogo
+
+    def items(self):
+        vistos = {}
+        for datos in self.perfiles.values():
+            for item in datos['items']: vistos.setdefault(item['link'], item)
+        return list(vistos.values())
+
+    def _buscar_producto(self, handle):
+        # Primero por handle exacto; si la API no filtra, buscamos por texto y exigimos el mismo handle
+        for params in ({'handle': handle}, {'q': handle.replace("-", " "), 'per_page': 20}):
+            res = self.transporte.get("/products", params=params)
+            if res.status_code == 404: continue
+            res.raise_for_status()
+            for p in res.json():
+                if handle in (p.get('handle') or {}).values(): return p
+        return None
+
+    def resolver(self, item_dict):
+        """
+        Toma un diccionario {link, foto} y completa el precio y nombre desde TN.
+        Si tiene foto manual, usa esa. Si no, la de la API.
+        """
+        resultado = info_por_defecto(item_dict)
+        p = self._buscar_producto(handle_desde_link(resultado['url']))
+        if p is None: return resultado
+        resultado['nombre'] = (p.get('name') or {}).get('es') or resultado['nombre']
+        precio = p.get('price') or (p.get('variants') or [{}])[0].get('price')
+        resultado['precio'] = float(precio) if precio else 0
+        if not item_dict.get('foto') and p.get('images'): resultado['foto'] = p['images'][0]['src']
+        return resultado
+
+    def _refrescar(self, item_dict):
+        link = item_dict['link']
+        try:
+            info = self.resolver(item_dict)
+            with self._lock:
+                anterior = self._entradas.get(link)
+                self._entradas[link] = (time.monotonic(), info)
+                if anterior is None or anterior[1] != info: self.version += 1
+        except Exception as e:
+            # Nos quedamos con el dato viejo; se reintenta en la próxima pasada
+            METRICAS.contar("errores", upstream="tiendanube", endpoint="/products", tipo=type(e).__name__)
+            print(f"Error buscando producto: {e}")
+        finally:
+            with self._lock: self._en_curso.discard(link)
+
+    def _reservar(self, link):
+        with self._lock:
+            if link in self._en_curso: return False
+            self._en_curso.add(link)
+        return True
+
+    def _programar(self, item_dict):
+        if not self._reservar(item_dict['link']): return None
+        return self._pool.submit(self._refrescar, item_dict)
+
+    def _por_vencer(self, link):
+        entrada = self._entradas.get(link)
+        return entrada is None or time.monotonic() - entrada[0] >= self.ttl * self.anticipo
+
+    async def calentar_async(self):
+        """Resuelve a la vez todo lo que falta o está por vencer."""
+        items = [item for item in self.items() if self._por_vencer(item['link']) and self._reservar(item['link'])]
+        await asyncio.gather(*(self.transporte.en_pool(self._refrescar, item) for item in items))
+        return len(items)
+
+    async def mantener_async(self, cada=60):
+        while True:
+            await self.calentar_async()
+            self.calentado.set()
+            await asyncio.sleep(cada)
+
+    def obtener(self, item_dict):
+        """Nunca bloquea: devuelve lo que haya (aunque esté viejo) y, si hace falta, refresca por detrás."""
+        entrada = self._entradas.get(item_dict['link'])
+        if self._por_vencer(item_dict['link']): self._programar(item_dict)
+        return entrada[1] if entrada else info_por_defecto(item_dict)
+
+    def recomendaciones(self, perfil):
+        """Productos ya resueltos (o su placeholder) de un perfil."""
+        with METRICAS.medir("etapa", etapa="recomendacion", perfil=perfil):
+            return [self.obtener(item) for item in self.perfiles[perfil]['items']]
+
+    def iniciar(self, bucle, cada=60):
+        """Calienta el catálogo y arranca (una sola vez) en `bucle` la corrutina que lo mantiene fresco."""
+        if self._mantenimiento is not None: return
+        self._mantenimiento = bucle.programar(self.mantener_async(cada), heredar=False)
@@ -0,0 +1,92 @@
+"""
+Worker de línea de comandos: el triage de la app sin navegador.
+
+Sincroniza con Tiendanube, corre la cascada de ARIA sobre una bandeja, decide
+MORA / APROBABLE / DIFERENCIA y, si se pide, etiqueta los pedidos y encola los
+mails. Escribe una línea JSON por evento (pensado para cron y para `jq`).
+
+    python cli.py sincronizar
+    python cli.py triage [--bandeja nuevos] [--limite 500] [--etiquetar] [--notificar] [--enviar]
+    python cli.py enviar
+
+Ejemplo de cron, todas las noches a las 3:
+    0 3 * * * cd /srv/gestor && python cli.py triage --etiquetar --notificar --enviar >> triage.jsonl
+
+La configuración sale de .streamlit/secrets.toml o de variables de entorno (ver motor.leer_config).
+Sale con código 1 si algo falló (sync, una acción o un mail).
+"""
+import argparse
+import json
+import sys
+import time
+
+from almacen import BANDEJAS
+from motor import SIN_CLIENTE, Motor, leer_config
+
+
+def emitir(evento, **datos):
+    print(json.dumps({'evento': evento, 'ts': round(time.time(), 3), **datos}, ensure_ascii=False), flush=True)
+
+
+def sincronizar(motor, args):
+    try:
+        emitir("sincronizado", pedidos=motor.sincronizar())
+        return True
+    except Exception as e:
+        emitir("error", etapa="sincronizar", detalle=str(e))
+        return False
+
+
+def enviar(motor, args):
+    """Vacía la bandeja de salida en este proceso (el hilo de fondo no sobrevive a un cron)."""
+    bandeja = motor.bandeja_salida(iniciar=False)
+    if bandeja is None:
+        emitir("error", etapa="enviar", detalle="Falta la configuración de email")
+        return False
+    fallidos_antes = bandeja.estadisticas().get('fallido', 0)
+    server = bandeja.despachar()  # Lo que falle y tenga reintentos queda reprogramado para la próxima corrida
+    if server is not None: bandeja._cerrar(server)
+    stats = bandeja.estadisticas()
+    emitir("bandeja_salida", **stats)
+    return stats.get('fallido', 0) <= fallidos_antes
+
+
+def triage(motor, args):
+    ok = True
+    if not args.sin_sincronizar: ok = sincronizar(motor, args)
+    # Un proceso de cron no tiene catálogo caliente: sin esto los primeros mails saldrían con placeholders
+    if args.notificar: motor.catalogo.calentado.wait(timeout=60)
+    resumen = {}
+    for evento in motor.triage(args.bandeja, limite=args.limite, etiquetar=args.etiquetar, notificar=args.notificar,
+                               hilos=args.hilos, iniciar_envio=False):
+        emitir("pedido", **evento)
+        clave = evento['decision'] or SIN_CLIENTE
+        resumen[clave] = resumen.get(clave, 0) + 1
+        ok = ok and all(a['ok'] for a in evento['acciones'])
+    emitir("resumen", bandeja=args.bandeja, **resumen)
+    if args.enviar: ok = enviar(motor, args) and ok
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triage de pedidos sin navegador")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("sincronizar", help="trae de Tiendanube lo que cambió desde la última vez")
+    p = sub.add_parser("triage", help="analiza una bandeja y, opcionalmente, etiqueta y avisa")
+    p.add_argument("--bandeja", default="nuevos", choices=list(BANDEJAS))
+    p.add_argument("--limite", type=int, default=None, help="máximo de pedidos (los más nuevos primero)")
+    p.add_argument("--etiquetar", action="store_true", help="aprobar los APROBABLES y marcar pendientes MORA/DIFERENCIA")
+    p.add_argument("--notificar", action="store_true", help="encolar el mail que corresponde a cada decisión")
+    p.add_argument("--enviar", action="store_true", help="al final, despachar la bandeja de salida")
+    p.add_argument("--sin-sincronizar", action="store_true", help="usar el almacén tal como está")
+    p.add_argument("--hilos", type=int, default=8)
+    sub.add_parser("enviar", help="despacha los mails pendientes de la bandeja de salida")
+    args = parser.parse_args(argv)
+
+    motor = Motor(leer_config())
+    ok = {"sincronizar": sincronizar, "triage": triage, "enviar": enviar}[args.comando](motor, args)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Bandeja de salida de correos.
+
+Los mails se encolan en SQLite y un hilo en segundo plano los despacha
+reutilizando una sola conexión SMTP autenticada para todos los que haya
+pendientes. Un envío fallido se reintenta con backoff exponencial en vez de
+perderse, y cada mensaje tiene una clave (pedido + escenario) que evita mandar
+dos veces lo mismo.
+"""
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+
+from metricas import METRICAS
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    destinatario TEXT NOT NULL,
+    mensaje TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo REAL NOT NULL,
+    error TEXT,
+    creado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_pendientes ON outbox(proximo) WHERE estado = 'pendiente';
+"""
+
+
+class BandejaSalida:
+    def __init__(self, ruta, smtp_server, smtp_port, smtp_user, smtp_pass,
+                 max_intentos=5, espera_base=30, inactividad=60, tam_lote=50, tls=True):
+        self.smtp_server = smtp_server
+        self.smtp_port = int(smtp_port)
+        self.tls = tls  # STARTTLS en puertos distintos de 465; sin TLS sólo para relays locales
+        self.smtp_user = smtp_user
+        self.smtp_pass = smtp_pass
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base  # Segundos antes del primer reintento; se duplica en cada uno
+        self.inactividad = inactividad  # Segundos que mantenemos abierta la conexión sin trabajo
+        self.tam_lote = tam_lote
+        self.con = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._hilo = None
+        self._ultimo_envio = 0.0
+        with self._lock, self.con:
+            self.con.executescript(ESQUEMA)
+
+    def encolar(self, clave, destinatario, mensaje):
+        """
+        Deja un mensaje (ya serializado) listo para enviar. Si la clave ya existe no hace nada,
+        salvo que el envío anterior haya fallado del todo: ahí lo vuelve a poner en cola.
+        Devuelve True si quedó en cola y False si era un duplicado que no cambió nada.
+        """
+        ahora = time.time()
+        with self._lock, self.con:
+            cursor = self.con.execute(
+                """INSERT INTO outbox (clave, destinatario, mensaje, proximo, creado) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(clave) DO UPDATE SET estado = 'pendiente', intentos = 0, error = NULL,
+                       destinatario = excluded.destinatario, mensaje = excluded.mensaje, proximo = excluded.proximo
+                   WHERE outbox.estado = 'fallido'""",
+                (clave, destinatario, mensaje, ahora, ahora),
+            )
+        if cursor.rowcount <= 0: return False
+        self._hay_trabajo.set()
+        return True
+
+    def estadisticas(self):
+        with self._lock:
+            filas = self.con.execute("SELECT estado, COUNT(*) FROM outbox GROUP BY estado").fetchall()
+        return dict(filas)
+
+    def _vencidos(self):
+        with self._lock:
+            return self.con.execute(
+                "SELECT id, destinatario, mensaje, intentos FROM outbox WHERE estado = 'pendiente' AND proximo <= ? ORDER BY proximo LIMIT ?",
+                (time.time(), self.tam_lote),
+            ).fetchall()
+
+    def _marcar_enviado(self, id_msg):
+        with self._lock, self.con:
+            self.con.execute("UPDATE outbox SET estado = 'enviado', intentos = intentos + 1, error = NULL WHERE id = ?", (id_msg,))
+
+    def _marcar_error(self, id_msg, intentos, error):
+        intentos += 1
+        estado = 'fallido' if intentos >= self.max_intentos else 'pendiente'
+        proximo = time.time() + self.espera_base * 2 ** (intentos - 1) * random.uniform(0.8, 1.2)
+        with self._lock, self.con:
+            self.con.execute("UPDATE outbox SET estado = ?, intentos = ?, proximo = ?, error = ? WHERE id = ?",
+                             (estado, intentos, proximo, str(error)[:500], id_msg))
+
+    def _conectar(self):
+        with METRICAS.medir("smtp", operacion="conectar"):
+            if self.smtp_port == 465: server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=20)
+            else:
+                server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=20)
+                if self.tls: server.starttls()
+            server.login(self.smtp_user, self.smtp_pass)
+        return server
+
+    @staticmethod
+    def _cerrar(server):
+        try: server.quit()
+        except Exception: pass
+
+    def despachar(self, server=None):
+        """Envía todo lo vencido sobre una misma conexión (la abre si hace falta). Devuelve la conexión o None."""
+        while True:
+            lote = self._vencidos()
+            if not lote: return server
+            if server is not None:
+                # El servidor pudo cortar la conexión ociosa; mejor enterarse antes de gastar un intento
+                try: server.noop()
+                except Exception:
+                    METRICAS.contar("smtp_conexiones_caidas")
+                    server = None
+            for id_msg, destinatario, mensaje, intentos in lote:
+                try:
+                    if server is None: server = self._conectar()
+                    with METRICAS.medir("smtp", operacion="enviar"):
+                        server.sendmail(self.smtp_user, destinatario, mensaje)
+                    self._ultimo_envio = time.monotonic()
+                    self._marcar_enviado(id_msg)
+                except Exception as e:
+                    METRICAS.contar("errores", upstream="smtp", tipo=type(e).__name__)
+                    self._marcar_error(id_msg, intentos, e)
+                    # La conexión puede haber quedado inservible: la próxima vez se abre una nueva
+                    if server is not None: self._cerrar(server)
+                    server = None
+
+    def iniciar(self):
+        """Arranca (una sola vez) el hilo que vacía la bandeja."""
+        if self._hilo is not None: return
+
+        def bucle():
+            server = None
+            while True:
+                self._hay_trabajo.clear()
+                try: server = self.despachar(server)
+                except Exception as e:
+                    METRICAS.contar("errores", upstream="outbox", tipo=type(e).__name__)
+                    print(f"Error en la bandeja de salida: {e}")
+                if server is not None and time.monotonic() - self._ultimo_envio > self.inactividad:
+                    self._cerrar(server)
+                    server = None
+                self._hay_trabajo.wait(timeout=5)
+
+        self._hilo = threading.Thread(target=bucle, name="bandeja-salida", daemon=True)
+        self._hilo.start()
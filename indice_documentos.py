@@ -0,0 +1,107 @@
+"""
+Índice local de documentos (DNI/CUIT) sobre un snapshot del padrón de ARIA.
+
+Resuelve en memoria las búsquedas por documento que antes iban a /clientes con
+`ident` y `q`. Cada CUIT se indexa completo y también por el DNI que lleva
+adentro (dígitos 3 a 10), así que un DNI encuentra al cliente cargado con CUIT y
+viceversa. El snapshot se guarda en SQLite para no esperar al arrancar (el índice
+por documento se rearma en memoria desde ahí), y un hilo en segundo plano lo
+vuelve a bajar cada tanto.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from aria import solo_numeros
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS aria_clientes (
+    cliente_id TEXT PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aria_snapshot (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def documentos_de(cliente):
+    """Claves normalizadas bajo las que se indexa un cliente."""
+    doc = solo_numeros(cliente.get('cliente_dnicuit'))
+    if len(doc) == 11: return [doc, doc[2:10]]
+    if len(doc) > 5: return [doc]
+    return []
+
+
+class IndiceDocumentos:
+    def __init__(self, ruta="pedidos.sqlite3"):
+        self.con = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._clientes = {}  # cliente_id -> dict
+        self._por_doc = {}  # doc -> [cliente_id, ...]
+        self.actualizado = None  # epoch del último snapshot
+        self._hilo = None
+        with self._lock, self.con:
+            self.con.executescript(ESQUEMA)
+        self._cargar_de_disco()
+
+    @property
+    def listo(self):
+        return bool(self._clientes)
+
+    def _armar(self, clientes):
+        por_doc = {}
+        for cid, c in clientes.items():
+            for doc in documentos_de(c):
+                ids = por_doc.setdefault(doc, [])
+                if cid not in ids: ids.append(cid)
+        return por_doc
+
+    def _cargar_de_disco(self):
+        with self._lock:
+            filas = self.con.execute("SELECT cliente_id, datos FROM aria_clientes").fetchall()
+            fila = self.con.execute("SELECT valor FROM aria_snapshot WHERE clave = 'actualizado'").fetchone()
+        clientes = {cid: json.loads(datos) for cid, datos in filas}
+        self._clientes, self._por_doc = clientes, self._armar(clientes)
+        self.actualizado = float(fila[0]) if fila else None
+
+    def reemplazar(self, clientes):
+        """Instala un snapshot nuevo (lista de clientes de ARIA) en memoria y en disco."""
+        nuevos = {str(c['cliente_id']): c for c in clientes if c.get('cliente_id')}
+        por_doc = self._armar(nuevos)
+        ahora = time.time()
+        with self._lock, self.con:
+            self.con.execute("DELETE FROM aria_clientes")
+            self.con.executemany("INSERT INTO aria_clientes VALUES (?, ?)", [(cid, json.dumps(c)) for cid, c in nuevos.items()])
+            self.con.execute("INSERT OR REPLACE INTO aria_snapshot VALUES ('actualizado', ?)", (str(ahora),))
+        # Un solo swap de referencias: los lectores ven el snapshot viejo o el nuevo, nunca uno a medias
+        self._clientes, self._por_doc, self.actualizado = nuevos, por_doc, ahora
+        return len(nuevos)
+
+    def buscar(self, documento):
+        """Clientes cuyo DNI o CUIT coincide exactamente con `documento` (o con el DNI dentro de ese CUIT)."""
+        n = solo_numeros(documento)
+        ids = self._por_doc.get(n)
+        if not ids and len(n) == 11: ids = self._por_doc.get(n[2:10])
+        clientes = self._clientes
+        return [clientes[cid] for cid in (ids or []) if cid in clientes]
+
+    def refrescar(self, cliente_aria):
+        return self.reemplazar(list(cliente_aria.listar_clientes()))
+
+    def iniciar_refresco(self, cliente_aria, intervalo=6 * 3600):
+        """Arranca (una sola vez) el hilo que mantiene el snapshot al día."""
+        if self._hilo is not None: return
+
+        def bucle():
+            while True:
+                vencido = self.actualizado is None or time.time() - self.actualizado >= intervalo
+                if vencido:
+                    try: self.refrescar(cliente_aria)
+                    except Exception as e: print(f"Error refrescando snapshot ARIA: {e}")
+                time.sleep(60 if vencido and not self.listo else min(intervalo, 600))
+
+        self._hilo = threading.Thread(target=bucle, name="refresco-indice-aria", daemon=True)
+        self._hilo.start()
@@ -0,0 +1,171 @@
+"""
+Métricas de los caminos calientes.
+
+Un registro en memoria, seguro entre hilos, de tiempos y contadores con
+etiquetas (upstream, endpoint, status, etapa...). Cada llamada saliente la
+registra el transporte; las etapas grandes (sincronización, bandejas, pasos de
+la cascada, recomendaciones, armado y envío de mails) se miden con `medir`.
+
+Guarda las últimas muestras de cada serie para sacar p50/p95 y un historial
+corto de eventos para ver qué pasó en un rerun. Cada evento lleva la corrida
+(un contextvar) del código que lo originó: así el costo de un rerun no se mezcla
+con el de otras sesiones ni con los hilos de fondo. Se exporta como JSON lines o
+en el formato de texto de Prometheus.
+"""
+import contextvars
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+_CORRIDA = contextvars.ContextVar("corrida_metricas", default=None)
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def percentil(ordenadas, q):
+    if not ordenadas: return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))]
+
+
+def _etiquetas_prometheus(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares: return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+class Metricas:
+    def __init__(self, muestras_por_serie=1024, max_eventos=10000):
+        self.muestras_por_serie = muestras_por_serie
+        self._contadores = {}  # (nombre, etiquetas) -> n
+        self._tiempos = {}  # (nombre, etiquetas) -> [n, suma, deque de las últimas muestras]
+        self._eventos = deque(maxlen=max_eventos)
+        self._secuencia = itertools.count(1)
+        self._corridas = itertools.count(1)
+        self._ultima = 0
+        self._lock = threading.Lock()
+
+    def contar(self, nombre, n=1, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + n
+            self._registrar_evento(clave, None)
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            serie = self._tiempos.get(clave)
+            if serie is None: serie = self._tiempos[clave] = [0, 0.0, deque(maxlen=self.muestras_por_serie)]
+            serie[0] += 1
+            serie[1] += segundos
+            serie[2].append(segundos)
+            self._registrar_evento(clave, segundos)
+
+    def _registrar_evento(self, clave, segundos):
+        self._ultima = next(self._secuencia)
+        self._eventos.append((self._ultima, time.time(), clave[0], clave[1], segundos, _CORRIDA.get()))
+
+    @contextmanager
+    def medir(self, nombre, **etiquetas):
+        """
+        Mide un bloque. Se pueden agregar etiquetas desde adentro (p. ej. el status de la respuesta);
+        si el bloque lanza una excepción y no se fijó 'resultado', queda como el nombre de la excepción.
+        """
+        inicio = time.perf_counter()
+        try:
+            yield etiquetas
+        except BaseException as e:
+            etiquetas.setdefault('resultado', type(e).__name__)
+            raise
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def iniciar_corrida(self):
+        """
+        Abre una corrida nueva en el contexto actual (p. ej. un rerun de la app) y devuelve su número.
+        Lo que se registre desde acá la lleva, también en lo que este código mande al event loop o a los pools.
+        """
+        corrida = next(self._corridas)
+        _CORRIDA.set(corrida)
+        return corrida
+
+    def terminar_corrida(self):
+        _CORRIDA.set(None)
+
+    def corrida_actual(self):
+        return _CORRIDA.get()
+
+    def marca(self):
+        """Número del último evento; con `eventos(desde=marca)` se ve lo que pasó después (p. ej. en un rerun)."""
+        return self._ultima
+
+    def eventos(self, desde=0, corrida=None):
+        """[(seq, ts, nombre, etiquetas, segundos, corrida)] desde una marca; con `corrida`, sólo los de esa corrida."""
+        with self._lock:
+            return [e for e in self._eventos if e[0] > desde and (corrida is None or e[5] == corrida)]
+
+    def desglose(self, desde=0, corrida=None):
+        """Tiempos agrupados por serie desde una marca (o de una corrida): [(nombre, etiquetas, n, segundos totales)], el más caro primero."""
+        grupos = {}
+        for _, _, nombre, etiquetas, segundos, _ in self.eventos(desde, corrida):
+            if segundos is None: continue
+            g = grupos.setdefault((nombre, etiquetas), [0, 0.0])
+            g[0] += 1
+            g[1] += segundos
+        return sorted(((n, dict(e), c, s) for (n, e), (c, s) in grupos.items()), key=lambda x: -x[3])
+
+    def resumen(self):
+        """Una fila por serie de tiempos: n, total y p50/p95 (de las últimas muestras)."""
+        with self._lock:
+            series = [(clave, n, suma, sorted(muestras)) for clave, (n, suma, muestras) in self._tiempos.items()]
+        return [{'metrica': nombre, 'etiquetas': dict(etiquetas), 'n': n, 'total': suma,
+                 'p50': percentil(ordenadas, 0.5), 'p95': percentil(ordenadas, 0.95)}
+                for (nombre, etiquetas), n, suma, ordenadas in sorted(series)]
+
+    def contadores(self):
+        with self._lock:
+            return [{'metrica': nombre, 'etiquetas': dict(etiquetas), 'valor': valor}
+                    for (nombre, etiquetas), valor in sorted(self._contadores.items())]
+
+    def exportar_jsonl(self, desde=0):
+        """Un evento por línea: {seq, ts, metrica, etiquetas, segundos, corrida} (segundos es null en los contadores)."""
+        return "".join(json.dumps({'seq': seq, 'ts': ts, 'metrica': nombre, 'etiquetas': dict(etiquetas), 'segundos': segundos,
+                                   'corrida': corrida}) + "\n"
+                       for seq, ts, nombre, etiquetas, segundos, corrida in self.eventos(desde))
+
+    def exportar_prometheus(self):
+        """Contadores como `_total` y tiempos como summary (quantiles 0.5/0.95, _sum y _count), en segundos."""
+        lineas = []
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            tiempos = sorted((clave, n, suma, sorted(muestras)) for clave, (n, suma, muestras) in self._tiempos.items())
+        tipos = set()
+        for (nombre, etiquetas), valor in contadores:
+            if nombre not in tipos:
+                tipos.add(nombre)
+                lineas.append(f"# TYPE {nombre}_total counter")
+            lineas.append(f"{nombre}_total{_etiquetas_prometheus(etiquetas)} {valor}")
+        for (nombre, etiquetas), n, suma, ordenadas in tiempos:
+            if nombre not in tipos:
+                tipos.add(nombre)
+                lineas.append(f"# TYPE {nombre}_segundos summary")
+            for q in (0.5, 0.95):
+                lineas.append(f"{nombre}_segundos{_etiquetas_prometheus(etiquetas, [('quantile', q)])} {percentil(ordenadas, q):.6f}")
+            lineas.append(f"{nombre}_segundos_sum{_etiquetas_prometheus(etiquetas)} {suma:.6f}")
+            lineas.append(f"{nombre}_segundos_count{_etiquetas_prometheus(etiquetas)} {n}")
+        return "\n".join(lineas) + "\n"
+
+    def limpiar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._tiempos.clear()
+            self._eventos.clear()
+
+
+METRICAS = Metricas()
@@ -0,0 +1,304 @@
+"""
+Motor de la app, sin Streamlit.
+
+Arma (a demanda, una sola vez) los recursos compartidos: transporte de
+Tiendanube, almacén, sincronizador, cliente de ARIA, catálogo, escritor de
+pedidos, bandeja de salida y renderizador de mails. También tiene la decisión
+de crédito (MORA / APROBABLE / DIFERENCIA) y el triage de una bandeja entera,
+que usan tanto la app de Streamlit como el worker de línea de comandos (cli.py).
+
+La E/S (sincronización, cascada de ARIA, refresco del catálogo) corre sobre un
+único event loop de fondo (bucle.py); las operaciones de acá lo esperan.
+A qué cliente se resolvió cada pedido queda guardado en el almacén: la próxima
+vez, si los datos del pedido no cambiaron, basta una consulta por ID.
+Los resultados de la cascada y los mails encolados alimentan la analítica (analitica.py).
+
+La configuración es la misma de .streamlit/secrets.toml; `leer_config` la lee
+sin Streamlit y deja que las variables de entorno la pisen.
+"""
+import os
+import threading
+import tomllib
+
+from almacen import AlmacenPedidos, TAG_APROBADO, TAG_PENDIENTE, huella_cliente
+from analitica import Analitica
+from aria import ARIA_URL_BASE, NO_RESPONDE, ClienteAria, metodo_de
+from bucle import Bucle
+from catalogo import CatalogoCrossSell
+from correo import BandejaSalida
+from indice_documentos import IndiceDocumentos
+from metricas import METRICAS
+from perfiles import CLASIFICADOR, PERFILES_INTERES
+from plantillas import ESCENARIO_APROBADO, ESCENARIO_DIFERENCIA, ESCENARIO_RECHAZADO, RenderizadorMails
+from tiendanube import TN_API_BASE, EscritorPedidos, SincronizadorPedidos, crear_transporte_tn
+
+TN_USER_AGENT = "RobotWeb (24705)"
+
+MORA = "MORA"
+APROBABLE = "APROBABLE"
+DIFERENCIA = "DIFERENCIA"
+SIN_CLIENTE = "SIN_CLIENTE"
+
+MAIL_ENCOLADO = "Encolado"
+MAIL_DUPLICADO = "Ya estaba en la bandeja"
+
+VARIABLES_ENTORNO = ("TN_TOKEN", "TN_ID", "TN_APP_SECRET", "ARIA_KEY", "DB_PATH", "ARIA_INDICE_LOCAL")
+VARIABLES_EMAIL = {"SMTP_SERVER": "smtp_server", "SMTP_PORT": "smtp_port", "SMTP_USER": "smtp_user", "SMTP_PASSWORD": "smtp_password"}
+
+
+def leer_config(ruta_secrets=".streamlit/secrets.toml"):
+    """secrets.toml (si existe) más las variables de entorno; el entorno gana."""
+    config = {}
+    if os.path.exists(ruta_secrets):
+        with open(ruta_secrets, "rb") as f: config.update(tomllib.load(f))
+    for clave in VARIABLES_ENTORNO:
+        if os.environ.get(clave): config[clave] = os.environ[clave]
+    email = {campo: os.environ[var] for var, campo in VARIABLES_EMAIL.items() if os.environ.get(var)}
+    if email: config["email"] = {**config.get("email", {}), **email}
+    return config
+
+
+def evaluar_credito(cli, total):
+    """Decisión para un pedido ya asociado a un cliente ARIA: (MORA | APROBABLE | DIFERENCIA, cupo, meses de atraso)."""
+    try: cupo = float(cli.get('clienteScoringFinanciable', 0) or 0)
+    except (TypeError, ValueError): cupo = 0.0
+    meses = int(cli.get('cliente_meses_atraso', 0) or 0)
+    if meses > 0: return MORA, cupo, meses
+    if total <= cupo: return APROBABLE, cupo, meses
+    return DIFERENCIA, cupo, meses
+
+
+class CuposEnCurso:
+    """
+    Lo que se va aprobando a cada cliente dentro de una misma corrida (un lote de la app, un triage).
+    Cada pedido se evalúa contra lo que queda del cupo, no contra el cupo entero: dos pedidos del mismo
+    cliente no se aprueban con la misma plata.
+    """
+
+    def __init__(self):
+        self._usado = {}  # cliente_id -> total ya aprobado en esta corrida
+
+    def evaluar(self, cli, total):
+        """Como evaluar_credito, con el cupo que le queda al cliente: (decisión, cupo restante, meses)."""
+        usado = self._usado.get(str(cli.get('cliente_id')), 0.0)
+        decision, cupo, meses = evaluar_credito(cli, total + usado)
+        return decision, cupo - usado, meses
+
+    def reservar(self, cli, total):
+        cid = str(cli.get('cliente_id'))
+        self._usado[cid] = self._usado.get(cid, 0.0) + total
+
+
+def datos_cliente(pedido):
+    """(nombre, documento, nota) tal como los usa la cascada."""
+    return pedido.cliente_nombre, pedido.cliente_ident, pedido.owner_note
+
+
+class Motor:
+    def __init__(self, config):
+        self.config = config
+        self._recursos = {}
+        self._lock = threading.RLock()
+
+    def _recurso(self, nombre, fabrica):
+        recurso = self._recursos.get(nombre)
+        if recurso is None:
+            with self._lock:
+                if nombre not in self._recursos: self._recursos[nombre] = fabrica()
+                recurso = self._recursos[nombre]
+        return recurso
+
+    @property
+    def ruta_db(self):
+        return self.config.get("DB_PATH", "pedidos.sqlite3")
+
+    # --- Recursos compartidos ---
+
+    @property
+    def bucle(self):
+        return self._recurso("bucle", Bucle)
+
+    @property
+    def transporte_tn(self):
+        # Un pool de conexiones y un cupo de API para todo (sync, catálogo y escrituras)
+        return self._recurso("transporte_tn", lambda: crear_transporte_tn(
+            self.config["TN_ID"], self.config["TN_TOKEN"], TN_USER_AGENT, url_base=self.config.get("TN_URL_BASE", TN_API_BASE)))
+
+    @property
+    def almacen(self):
+        return self._recurso("almacen", lambda: AlmacenPedidos(self.ruta_db))
+
+    @property
+    def analitica(self):
+        # Sus triggers cuelgan de la tabla de pedidos: el almacén tiene que existir antes
+        def crear():
+            self.almacen
+            return Analitica(self.ruta_db)
+        return self._recurso("analitica", crear)
+
+    @property
+    def sincronizador(self):
+        return self._recurso("sincronizador", lambda: SincronizadorPedidos(self.transporte_tn, self.almacen))
+
+    @property
+    def cliente_aria(self):
+        def crear():
+            cliente = ClienteAria(self.config["ARIA_KEY"], self.config.get("ARIA_URL_BASE", ARIA_URL_BASE))
+            if str(self.config.get("ARIA_INDICE_LOCAL", "")).lower() in ("1", "true", "si", "sí"):
+                cliente.indice = IndiceDocumentos(self.ruta_db)
+                cliente.indice.iniciar_refresco(cliente)
+            return cliente
+        return self._recurso("cliente_aria", crear)
+
+    @property
+    def catalogo(self):
+        # Se calienta en paralelo al arrancar y se refresca solo (en el loop); los mails nunca esperan a TN
+        def crear():
+            catalogo = CatalogoCrossSell(self.transporte_tn, PERFILES_INTERES)
+            catalogo.iniciar(self.bucle)
+            return catalogo
+        return self._recurso("catalogo", crear)
+
+    @property
+    def escritor(self):
+        return self._recurso("escritor", lambda: EscritorPedidos(self.transporte_tn, almacen=self.almacen))
+
+    @property
+    def renderizador(self):
+        # Cachea el bloque de cross-selling por perfil mientras el catálogo no cambie
+        remitente = (self.config.get("email") or {}).get("smtp_user", "")
+        return self._recurso("renderizador", lambda: RenderizadorMails(self.catalogo, CLASIFICADOR, remitente))
+
+    def bandeja_salida(self, iniciar=True):
+        """La bandeja de salida, o None si falta la configuración de email. `iniciar` arranca el hilo que la vacía."""
+        def crear():
+            try:
+                cfg = self.config["email"]
+                return BandejaSalida(self.ruta_db, cfg["smtp_server"], cfg["smtp_port"], cfg["smtp_user"], cfg["smtp_password"],
+                                     tls=cfg.get("smtp_tls", True))
+            except (KeyError, TypeError):
+                return False
+        bandeja = self._recurso("bandeja", crear) or None
+        if bandeja is not None and iniciar: bandeja.iniciar()
+        return bandeja
+
+    # --- Operaciones ---
+
+    def sincronizar(self):
+        return self.bucle.correr(self.sincronizador.sincronizar_async())
+
+    def _recordar(self, pedido_id, datos, previo, cli, msg):
+        """Guarda (o descarta) la resolución de un pedido; si no cambió, no escribe. Si ARIA no respondió, la deja como estaba."""
+        if msg == NO_RESPONDE:
+            METRICAS.contar("resoluciones", memo="sin_respuesta")
+            return
+        acierto = cli is not None and previo == (str(cli['cliente_id']), msg)
+        if cli is None:
+            if previo is not None: self.almacen.olvidar_resolucion(pedido_id)
+        elif not acierto:
+            self.almacen.guardar_resolucion(pedido_id, huella_cliente(*datos), cli['cliente_id'], metodo_de(msg), msg)
+        METRICAS.contar("resoluciones", memo="acierto" if acierto else "sin_memo" if previo is None else "obsoleto")
+
+    def buscar_cliente(self, nombre, dni, nota, pedido_id=None):
+        """Cascada de un pedido; con `pedido_id` usa y actualiza la resolución guardada."""
+        datos = (nombre, dni, nota)
+        previo = self.almacen.resoluciones({pedido_id: datos}).get(pedido_id) if pedido_id is not None else None
+        cli, msg = self.bucle.correr(self.cliente_aria.buscar_cliente_cascada_async(*datos, previo=previo))
+        if pedido_id is not None: self._recordar(pedido_id, datos, previo, cli, msg)
+        return cli, msg
+
+    def analizar_lote(self, solicitudes, hilos=8):
+        """{pedido_id: (nombre, dni, nota)} -> genera (pedido_id, cliente, mensaje) a medida que se resuelven."""
+        previos = self.almacen.resoluciones(solicitudes)
+        for pid, cli, msg in self.bucle.iterar(self.cliente_aria.analizar_lote_async(solicitudes, concurrencia=hilos, previos=previos)):
+            self._recordar(pid, solicitudes[pid], previos.get(pid), cli, msg)
+            yield pid, cli, msg
+
+    def recomendaciones(self, nombres):
+        """Perfil del pedido (uno o varios nombres de producto) y sus items ya enriquecidos por el catálogo."""
+        perfil = CLASIFICADOR.clasificar(nombres)
+        return self.catalogo.recomendaciones(perfil), perfil
+
+    def notificar(self, email_cliente, nombre_cliente, escenario, datos_extra={}, iniciar_envio=True):
+        """
+        Arma el mail y lo deja en la bandeja de salida. Devuelve (ok, detalle), como las acciones del escritor:
+        un mail que ya estaba en la bandeja es ok (MAIL_DUPLICADO) pero no se vuelve a encolar ni a contar.
+        """
+        bandeja = self.bandeja_salida(iniciar=iniciar_envio)
+        if bandeja is None: return False, "Falta la configuración de email"
+        if not email_cliente: return False, "El pedido no tiene email"
+        with METRICAS.medir("etapa", etapa="notificacion", escenario=escenario):
+            mensaje = self.renderizador.mensaje(email_cliente, nombre_cliente, escenario, datos_extra)
+            if mensaje is None: return False, "No se pudo armar el mail"
+            # Clave de deduplicación: un mismo escenario no se manda dos veces para el mismo pedido
+            clave = f"{datos_extra.get('id_visual', 'S/N')}:{escenario}"
+            if not bandeja.encolar(clave, email_cliente, mensaje): return True, MAIL_DUPLICADO
+        nombres = datos_extra.get('nombres_productos')
+        self.analitica.registrar_notificacion(clave, escenario, CLASIFICADOR.clasificar(nombres) if nombres else None)
+        return True, MAIL_ENCOLADO
+
+    def registrar_analisis(self, pedido, cli, msg):
+        """Decide (como evaluar_credito; sin cliente, todo None) y deja el resultado en la analítica."""
+        decision, cupo, meses = evaluar_credito(cli, pedido.total) if cli else (None, None, None)
+        self.analitica.registrar_analisis(pedido.id, metodo_de(msg), decision or SIN_CLIENTE, pedido.total, cupo or 0.0)
+        return decision, cupo, meses
+
+    def analizar(self, pedidos, hilos=8):
+        """
+        Cascada y decisión para muchos pedidos a la vez. Genera, a medida que terminan,
+        (pedido, cliente, mensaje, decisión, cupo, meses); sin cliente, decisión/cupo/meses son None.
+        """
+        por_id = {p.id: p for p in pedidos}
+        solicitudes = {pid: datos_cliente(p) for pid, p in por_id.items()}
+        for pid, cli, msg in self.analizar_lote(solicitudes, hilos=hilos):
+            p = por_id[pid]
+            yield p, cli, msg, *self.registrar_analisis(p, cli, msg)
+
+    def aplicar_decision(self, pedido, cli, decision, cupo, etiquetar=True, notificar=True, iniciar_envio=True):
+        """
+        Lo mismo que los botones de la app: MORA avisa el rechazo y marca pendiente, DIFERENCIA pide la
+        diferencia y marca pendiente, APROBABLE aprueba y avisa. Devuelve [(acción, ok, detalle)].
+        """
+        nombre, email, total = pedido.cliente_nombre, pedido.cliente_email, pedido.total
+        datos = {'id_visual': pedido.id_visual, 'nombres_productos': pedido.nombres_productos}
+        acciones = []
+        if decision == APROBABLE:
+            if etiquetar:
+                ok, detalle = self.escritor.aprobar(pedido, TAG_APROBADO)
+                acciones.append(("aprobar", ok, detalle))
+                if not ok: return acciones
+                self.cliente_aria.invalidar_cliente(cli.get('cliente_id'))
+            if notificar:
+                ok, detalle = self.notificar(email, nombre, ESCENARIO_APROBADO, datos, iniciar_envio)
+                acciones.append(("mail", ok, f"aprobado: {detalle}"))
+            return acciones
+        escenario, extra = (ESCENARIO_RECHAZADO, {}) if decision == MORA else (ESCENARIO_DIFERENCIA, {'cupo': cupo, 'diferencia': total - cupo})
+        if notificar:
+            ok, detalle = self.notificar(email, nombre, escenario, {**datos, **extra}, iniciar_envio)
+            acciones.append(("mail", ok, f"{'rechazo' if decision == MORA else 'diferencia'}: {detalle}"))
+            if not ok: return acciones
+        if etiquetar: acciones.append(("etiquetar", *self.escritor.etiquetar(pedido, TAG_PENDIENTE)))
+        return acciones
+
+    def triage(self, bandeja="nuevos", limite=None, etiquetar=False, notificar=False, hilos=8, iniciar_envio=True):
+        """
+        Analiza una bandeja del almacén y, opcionalmente, aplica etiquetas y encola mails.
+        Genera un dict por pedido (listo para JSON), a medida que se resuelve.
+        """
+        pedidos = self.almacen.bandeja(bandeja, limite=limite)
+        cupos = CuposEnCurso()  # Dos pedidos del mismo cliente no se aprueban contra el mismo cupo
+        with METRICAS.medir("etapa", etapa="triage", bandeja=bandeja):
+            for p, cli, msg, decision, cupo, meses in self.analizar(pedidos, hilos=hilos):
+                if cli is not None: decision, cupo, meses = cupos.evaluar(cli, p.total)
+                evento = {
+                    'id': p.id, 'numero': p.numero, 'cliente': p.cliente_nombre,
+                    'total': p.total, 'cliente_id': cli.get('cliente_id') if cli else None,
+                    'metodo': metodo_de(msg), 'decision': decision, 'cupo': cupo, 'meses_atraso': meses, 'acciones': [],
+                }
+                if cli is not None and (etiquetar or notificar):
+                    evento['acciones'] = [{'accion': a, 'ok': ok, 'detalle': d}
+                                          for a, ok, d in self.aplicar_decision(p, cli, decision, cupo, etiquetar, notificar, iniciar_envio)]
+                if decision == APROBABLE and all(a['ok'] for a in evento['acciones'] if a['accion'] == "aprobar"):
+                    cupos.reservar(cli, p.total)
+                METRICAS.contar("triage_decisiones", decision=decision or SIN_CLIENTE)
+                yield evento
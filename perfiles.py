@@ -0,0 +1,132 @@
+"""
+Perfiles de interés para el cross-selling y el clasificador que elige uno por pedido.
+
+El clasificador arma una sola vez un índice con todas las keywords y compara por
+palabras enteras ("pc" ya no matchea dentro de otra palabra), puntuando cada
+perfil con todos los productos del pedido. Gana el de más coincidencias; a igual puntaje,
+el que está antes en PERFILES_INTERES. Sin coincidencias, HOGAR.
+"""
+import re
+import unicodedata
+
+# ==========================================
+# 🧠 CEREBRO DE CROSS-SELLING (TUS REGLAS)
+# ==========================================
+# ⚠️ IMPORTANTE: PARA QUE LAS FOTOS NO SE ROMPAN, AGREGA EL CAMPO "foto" CON EL LINK DE LA IMAGEN
+# Si no ponés foto, el robot intentará buscarla, pero puede fallar.
+
+PERFILES_INTERES = {
+    "GAMING": {
+        "keywords": ["gamer", "juego", "playstation", "ps4", "ps5", "joystick", "rtx", "teclado", "mecanico", "redragon", "pc", "mouse"],
+        "items": [
+            {"link": "https://ssstore.com.ar/productos/mouse-cerberus-redragon-m703/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/auricular-vincha-cronus-redragon-h211w-rgb/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/teclado-aditya-redragon-k513-rgb-sin-n/", "foto": ""}
+        ]
+    },
+    "CONECTIVIDAD": {
+        "keywords": ["starlink", "router", "antena", "wifi", "ubiquiti", "internet", "mesh", "cable", "red"],
+        "items": [
+            {"link": "https://ssstore.com.ar/productos/router-wifi-huaweii-ax2s-ws700v2/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/cable-starlink-mini-usb-c-a-fuente-portatil-usa-tu-antena-con-power-bank-n9thq/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/router-mesh-tp-link-deco-xe75-wifi-6e-ax5400-blanco-negro-1u/", "foto": ""}
+        ]
+    },
+    "MOVILIDAD": {
+        "keywords": ["samsung", "iphone", "motorola", "celular", "xiaomi", "smartphone", "apple", "android"],
+        "items": [
+            {"link": "https://ssstore.com.ar/productos/cable-foxbox-pixel-100w-con-display-lcd-usb-c-a-usb-c-egdem/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/cargador-de-auto-foxbox-way-qc-3-0-30w-carga-rapida-qualcomm-rfgoa/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/cargador-foxbox-mega-30w-gan-negro-para-iphone-cable-lightning-j8nie/", "foto": ""}
+        ]
+    },
+    "HOGAR": {
+        "keywords": ["tv", "smart", "televisor", "google", "android tv", "4k", "led", "ups", "casa"],
+        "items": [
+            {"link": "https://ssstore.com.ar/productos/auriculares-inalambricos-foxbox-clarity-negro-control-tactil-y-asistente-de-voz-qi0kh/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/ups-marsriva-kp2-ultra-16000mah-5v-12v-bivolt/", "foto": ""},
+            {"link": "https://ssstore.com.ar/productos/freidora-de-aire-foxbox-aeris-6l-digital-1500w-sin-aceite-yufou/", "foto": ""}
+        ]
+    }
+}
+
+PERFIL_DEFECTO = "HOGAR"
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes, para que "mecánico" matchee "mecanico"."""
+    texto = str(texto).lower()
+    if texto.isascii(): return texto
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def _con_plurales(palabras):
+    """La keyword y sus plurales ("juego" -> "juegos", "red" -> "redes"); el plural va en la última palabra."""
+    *inicio, ultima = palabras
+    return [(*inicio, ultima), (*inicio, ultima + "s"), (*inicio, ultima + "es")]
+
+
+class ClasificadorPerfiles:
+    def __init__(self, perfiles=PERFILES_INTERES, defecto=PERFIL_DEFECTO):
+        self.perfiles = list(perfiles)
+        self.defecto = defecto
+        # Índice (tupla de palabras) -> perfiles que la usan, con los plurales ya expandidos. Buscar es
+        # un lookup por palabra del producto, así que el costo no crece con la cantidad de keywords.
+        self._perfiles_de = {}
+        for i, datos in enumerate(perfiles.values()):
+            for kw in datos['keywords']:
+                palabras = tuple(_PALABRA.findall(normalizar_texto(kw)))
+                if not palabras: continue
+                for clave in _con_plurales(palabras):
+                    indices = self._perfiles_de.setdefault(clave, [])
+                    if i not in indices: indices.append(i)
+        self._simples = {clave[0]: indices for clave, indices in self._perfiles_de.items() if len(clave) == 1}
+        # Palabras con las que empieza alguna keyword compuesta ("android" por "android tv")
+        self._inicios = {}
+        for clave in self._perfiles_de:
+            if len(clave) > 1: self._inicios[clave[0]] = max(self._inicios.get(clave[0], 0), len(clave))
+
+    def _coincidencias(self, nombre):
+        """Perfiles de cada keyword presente en un nombre, como palabras enteras."""
+        palabras = _PALABRA.findall(normalizar_texto(nombre))
+        simples, inicios, perfiles_de = self._simples, self._inicios, self._perfiles_de
+        i = 0
+        while i < len(palabras):
+            palabra = palabras[i]
+            largo = inicios.get(palabra)
+            if largo:
+                # La keyword más larga primero: "android tv" gana sobre "android"
+                n = next((n for n in range(min(largo, len(palabras) - i), 1, -1) if tuple(palabras[i:i + n]) in perfiles_de), 0)
+                if n:
+                    yield perfiles_de[tuple(palabras[i:i + n])]
+                    i += n
+                    continue
+            indices = simples.get(palabra)
+            if indices: yield indices
+            i += 1
+
+    def puntajes(self, nombres_productos):
+        puntos = [0] * len(self.perfiles)
+        for nombre in nombres_productos:
+            for indices in self._coincidencias(nombre):
+                for i in indices: puntos[i] += 1
+        return puntos
+
+    def clasificar(self, nombres_productos):
+        """Perfil para un pedido. Acepta el nombre de un producto o la lista de todos los del pedido."""
+        if isinstance(nombres_productos, str): nombres_productos = [nombres_productos]
+        puntos = self.puntajes(nombres_productos)
+        mejor = max(range(len(puntos)), key=lambda i: (puntos[i], -i))
+        return self.perfiles[mejor] if puntos[mejor] > 0 else self.defecto
+
+    def clasificar_lote(self, pedidos):
+        """Clasifica muchos pedidos de una vez: recibe una lista de listas de nombres de producto."""
+        clasificar = self.clasificar
+        return [clasificar(nombres) for nombres in pedidos]
+
+
+CLASIFICADOR = ClasificadorPerfiles()
@@ -0,0 +1,155 @@
+"""
+Armado de los mails a clientes.
+
+Las plantillas de cada escenario se parsean una sola vez y renderizar es sólo
+intercalar valores. El bloque de cross-selling es igual para todos los clientes
+de un mismo perfil, así que se arma una vez por perfil y se reutiliza hasta que
+el catálogo cambia (el catálogo lleva un número de versión).
+"""
+import html
+import string
+import threading
+import urllib.parse
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from metricas import METRICAS
+
+NUMERO_WHATSAPP = "5491153748291"
+
+ESCENARIO_RECHAZADO = 1
+ESCENARIO_DIFERENCIA = 2
+ESCENARIO_APROBADO = 3
+
+
+class PlantillaCompilada:
+    """Una plantilla estilo str.format parseada de antemano: render() no vuelve a parsear nada."""
+
+    def __init__(self, texto):
+        self._partes = [(literal, campo, formato) for literal, campo, formato, _ in string.Formatter().parse(texto)]
+
+    def render(self, valores):
+        salida = []
+        for literal, campo, formato in self._partes:
+            salida.append(literal)
+            if campo is not None: salida.append(format(valores[campo], formato) if formato else str(valores[campo]))
+        return "".join(salida)
+
+
+STYLE_BASE = "font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333; line-height: 1.6; max-width: 600px; margin: auto;"
+
+TARJETA_PRODUCTO = PlantillaCompilada("""
+                <td style="width: 33%; padding: 10px; text-align: center; border: 1px solid #f0f0f0; border-radius: 8px; background: #fff;">
+                    <a href="{url}" style="text-decoration: none; color: #333; display: block;">
+                        <img src="{foto}" alt="{nombre}" style="width: 100%; max-width: 120px; height: 120px; object-fit: contain; margin-bottom: 10px;">
+                        <p style="font-size: 13px; margin: 0 0 5px; height: 36px; overflow: hidden; line-height: 1.2;"><strong>{nombre}</strong></p>
+                        <p style="color: #28a745; font-weight: bold; font-size: 14px; margin: 5px 0;">{precio_fmt}</p>
+                        <div style="background: #007bff; color: white; padding: 6px 10px; border-radius: 4px; font-size: 12px; display: inline-block;">VER OFERTA</div>
+                    </a>
+                </td>
+                """)
+
+BLOQUE_CROSS = PlantillaCompilada("""
+            <div style="background-color: #f9f9f9; padding: 20px; border-radius: 10px; margin-top: 30px; border: 1px solid #eee;">
+                <h3 style="text-align: center; color: #444; margin-top: 0;">🔥 Recomendados para vos ({perfil}) 🔥</h3>
+                <p style="text-align: center; font-size: 13px; color: #777; margin-bottom: 15px;">Completá tu experiencia con estos accesorios:</p>
+                <table width="100%" cellpadding="5" cellspacing="5" style="border-collapse: separate; border-spacing: 10px;">
+                    <tr>{filas}</tr>
+                </table>
+            </div>
+            """)
+
+MARCO = PlantillaCompilada("""<div style="{style_base}">{cuerpo}{cross}<br><hr style="border:0;border-top:1px solid #eee"><small style="color:#999">SSServicios Team</small></div>""")
+
+# escenario -> (asunto, cuerpo)
+ESCENARIOS = {
+    ESCENARIO_RECHAZADO: (PlantillaCompilada("Actualización pedido #{id_visual}"), PlantillaCompilada("""
+            <p>Hola <strong>{nombre_cliente}</strong>,</p>
+            <p>Recibimos tu pedido <strong>#{id_visual}</strong>. Al procesar la financiación, el sistema indica que no tenés cupo disponible actualmente.</p>
+            <p><strong>¡No pierdas tu compra!</strong> Reservamos tu pedido 24hs para que abones con transferencia o tarjeta.</p>
+            <p>Respondé este mail para solicitar el link de pago.</p>
+        """)),
+    ESCENARIO_DIFERENCIA: (PlantillaCompilada("Finalizá tu pedido #{id_visual}"), PlantillaCompilada("""
+            <p>Hola <strong>{nombre_cliente}</strong>,</p>
+            <p>¡Buenas noticias! Aprobamos parcialmente tu financiación.<br>
+            Cupo disponible: <strong>${cupo:,.0f}</strong></p>
+            <div style="background: #fff3cd; padding: 15px; border-left: 5px solid #ffc107; margin: 15px 0;">
+                <p style="margin:0">Resta abonar una diferencia de: <strong style="font-size:1.2em">${diferencia:,.0f}</strong></p>
+            </div>
+            <p><strong>Transferencia:</strong><br>Banco BBVA | CBU: 0170272120000001018527<br>Alias: SSSERVICIOS.MP</p>
+            <p style="text-align: center; margin-top: 20px;">
+                <a href="{link_ws}" style="background: #25D366; color: white; padding: 12px 20px; text-decoration: none; border-radius: 5px; font-weight: bold;">👉 ENVIAR COMPROBANTE</a>
+            </p>
+        """)),
+    ESCENARIO_APROBADO: (PlantillaCompilada("¡Aprobado! Pedido #{id_visual} ✅"), PlantillaCompilada("""
+            <p>Hola <strong>{nombre_cliente}</strong>,</p>
+            <p>Confirmamos que la financiación de tu pedido <strong>#{id_visual}</strong> fue <strong>APROBADA</strong>.</p>
+            <p>El importe se verá en tu próxima factura en 3 cuotas sin interés. Ya estamos preparando tu paquete.</p>
+            <p>¡Gracias por elegirnos!</p>
+        """)),
+}
+
+
+def link_whatsapp(id_visual):
+    texto_ws = f"Hola SSServicios, envío comprobante diferencia pedido #{id_visual}."
+    return f"https://wa.me/{NUMERO_WHATSAPP}?text={urllib.parse.quote(texto_ws)}"
+
+
+class RenderizadorMails:
+    def __init__(self, catalogo, clasificador, remitente):
+        self.catalogo = catalogo
+        self.clasificador = clasificador
+        self.remitente = remitente
+        self._cross = {}  # perfil -> (versión del catálogo, html)
+        self._lock = threading.Lock()
+
+    def bloque_cross(self, perfil):
+        """HTML de recomendados para un perfil; se rearma sólo si el catálogo cambió desde la última vez."""
+        version = self.catalogo.version
+        cacheado = self._cross.get(perfil)
+        if cacheado and cacheado[0] == version: return cacheado[1]
+        recomendados = self.catalogo.recomendaciones(perfil)
+        bloque = ""
+        if recomendados:
+            filas = "".join(TARJETA_PRODUCTO.render({
+                'url': p['url'], 'foto': p['foto'], 'nombre': html.escape(p['nombre']),
+                'precio_fmt': f"${p['precio']:,.0f}" if p['precio'] > 0 else "Ver Precio",
+            }) for p in recomendados)
+            bloque = BLOQUE_CROSS.render({'perfil': perfil, 'filas': filas})
+        with self._lock: self._cross[perfil] = (version, bloque)
+        return bloque
+
+    def renderizar(self, nombre_cliente, escenario, datos_extra={}):
+        """Devuelve (asunto, html) o None si el escenario no existe."""
+        if escenario not in ESCENARIOS: return None
+        with METRICAS.medir("etapa", etapa="render", escenario=escenario):
+            return self._renderizar(nombre_cliente, escenario, datos_extra)
+
+    def _renderizar(self, nombre_cliente, escenario, datos_extra):
+        asunto, cuerpo = ESCENARIOS[escenario]
+        id_visual = datos_extra.get('id_visual', 'S/N')
+        valores = {
+            'id_visual': id_visual, 'nombre_cliente': html.escape(str(nombre_cliente)),
+            'cupo': datos_extra.get('cupo', 0), 'diferencia': datos_extra.get('diferencia', 0),
+            'link_ws': link_whatsapp(id_visual) if escenario == ESCENARIO_DIFERENCIA else "",
+        }
+        # Se clasifica con todos los productos del pedido; 'nombre_producto_base' queda por compatibilidad
+        nombres_productos = datos_extra.get('nombres_productos') or [n for n in [datos_extra.get('nombre_producto_base', '')] if n]
+        cross = self.bloque_cross(self.clasificador.clasificar(nombres_productos)) if nombres_productos else ""
+        return asunto.render(valores), MARCO.render({'style_base': STYLE_BASE, 'cuerpo': cuerpo.render(valores), 'cross': cross})
+
+    def mensaje(self, email_cliente, nombre_cliente, escenario, datos_extra={}):
+        """El mail completo, serializado y listo para la bandeja de salida (o None si el escenario no existe)."""
+        renderizado = self.renderizar(nombre_cliente, escenario, datos_extra)
+        if renderizado is None: return None
+        asunto, html_final = renderizado
+        msg = MIMEMultipart()
+        msg['From'] = f"SSServicios <{self.remitente}>"
+        msg['To'] = email_cliente
+        msg['Subject'] = asunto
+        msg.attach(MIMEText(html_final, 'html'))
+        return msg.as_string()
+
+    def mensajes_lote(self, solicitudes):
+        """Renderiza muchos mails: `solicitudes` es una lista de (email, nombre, escenario, datos_extra)."""
+        return [self.mensaje(*s) for s in solicitudes]
@@ -0,0 +1,244 @@
+"""
+Sincronización de pedidos con Tiendanube.
+
+Recorre todas las páginas del listado de pedidos (en paralelo, sobre el
+transporte compartido de Tiendanube) y, después de la primera carga, pide sólo los pedidos
+modificados desde el último cursor (`updated_at_min`), fusionándolos en el
+almacén local.
+
+Cada página pide sólo los campos que usa la app (`fields`) y se lee a medida que
+llega: cada pedido se proyecta a un `Pedido` apenas se termina de parsear, sin
+armar nunca la lista de JSON completa.
+
+La sincronización corre sobre el event loop compartido (bucle.py): las páginas
+salen juntas por el pool del transporte, sin hilos propios.
+
+También tiene las escrituras sobre pedidos (aprobar, etiquetar, cancelar), de a
+uno o en lote. El cupo de pedidos de la API lo cuida el token bucket del transporte.
+"""
+import asyncio
+import codecs
+import contextvars
+import json
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from almacen import Pedido
+from metricas import METRICAS
+from transporte import CuboTokens, Transporte
+
+TN_API_BASE = "https://api.tiendanube.com/v1"
+TN_PER_PAGE = 200  # Máximo que acepta la API por página
+# Campos de primer nivel que usa Pedido; la API no recorta dentro de customer ni products
+TN_CAMPOS_PEDIDO = "id,number,status,payment_status,owner_note,total,updated_at,customer,products"
+TN_BLOQUE_LECTURA = 64 * 1024
+
+_SEPARADORES = re.compile(r"[\s,]*")
+
+# (conexión, lectura) por endpoint
+TN_TIMEOUTS = {
+    "/orders": (5, 20),
+    "/products": (5, 10),
+}
+
+
+def crear_transporte_tn(tienda_id, token, user_agent, pool=10, url_base=TN_API_BASE):
+    """
+    Un solo transporte por tienda: el pool de conexiones y el cupo de la API (40 pedidos, se reponen
+    2 por segundo, ajustado con los headers x-rate-limit-*) se comparten entre lecturas y escrituras.
+    `url_base` permite apuntar a otra API (p. ej. los servidores falsos de benchmarks/).
+    """
+    return Transporte(
+        f"{url_base.rstrip('/')}/{tienda_id}",
+        {'Authentication': f'bearer {token}', 'User-Agent': user_agent, 'Content-Type': 'application/json'},
+        pool=pool, timeouts=TN_TIMEOUTS, limitador=CuboTokens(capacidad=40, ritmo=2.0), nombre="tiendanube",
+    )
+
+
+def iterar_array_json(pedazos):
+    """
+    Genera los objetos de un array JSON que llega en pedazos de texto, a medida que se completan
+    (sin ijson: raw_decode sobre un buffer que sólo guarda lo que falta parsear).
+    """
+    decodificador = json.JSONDecoder()
+    buffer, abierto = "", False
+    for pedazo in pedazos:
+        buffer += pedazo
+        pos = 0
+        while True:
+            pos = _SEPARADORES.match(buffer, pos).end()
+            if pos == len(buffer): break
+            if not abierto:
+                if buffer[pos] != "[": raise ValueError("Se esperaba un array JSON")
+                abierto, pos = True, pos + 1
+                continue
+            if buffer[pos] == "]": return
+            try: elemento, pos = decodificador.raw_decode(buffer, pos)
+            except json.JSONDecodeError: break  # El objeto todavía no llegó entero
+            yield elemento
+        buffer = buffer[pos:]
+    raise ValueError("Array JSON incompleto")
+
+
+def pedidos_de(res):
+    """Los pedidos de una respuesta (leída en modo stream) ya proyectados."""
+    pedazos = codecs.iterdecode(res.iter_content(TN_BLOQUE_LECTURA), res.encoding or "utf-8")
+    return [Pedido.desde_tn(p) for p in iterar_array_json(pedazos)]
+
+
+class SincronizadorPedidos:
+    """
+    Mantiene el almacén local al día con la tienda.
+    La primera sincronización baja todo (un listado por estado, cancelados incluidos, en paralelo);
+    las siguientes, sólo el delta.
+    El cursor se guarda en el almacén, así que un reinicio no obliga a bajar todo de nuevo.
+    """
+
+    def __init__(self, transporte, almacen, estados=("open", "closed", "cancelled")):
+        self.transporte = transporte
+        self.almacen = almacen
+        self.estados = estados
+        self._lock = asyncio.Lock()
+
+    @property
+    def cursor(self):
+        """Mayor updated_at visto."""
+        return self.almacen.leer_meta('cursor_pedidos')
+
+    def _traer_pagina(self, params, pagina):
+        res = self.transporte.get("/orders", params={**params, 'fields': TN_CAMPOS_PEDIDO, 'page': pagina, 'per_page': TN_PER_PAGE},
+                                  stream=True)
+        with res:
+            if res.status_code == 404: return [], res  # TN responde 404 cuando la página no tiene resultados
+            res.raise_for_status()
+            return pedidos_de(res), res
+
+    def _traer_de_a_una(self, params, pagina):
+        # Sin total no sabemos cuántas páginas hay: seguimos de a una hasta una página incompleta
+        pedidos = []
+        while True:
+            lote, _ = self._traer_pagina(params, pagina)
+            pedidos.extend(lote)
+            if len(lote) < TN_PER_PAGE: return pedidos
+            pagina += 1
+
+    async def traer_todos_async(self, params):
+        """Baja todas las páginas de un listado. La primera define cuántas faltan; el resto va a la vez."""
+        pedidos, res = await self.transporte.en_pool(self._traer_pagina, params, 1)
+        if len(pedidos) < TN_PER_PAGE: return pedidos
+
+        total = res.headers.get('X-Total-Count')
+        if total is None: return pedidos + await self.transporte.en_pool(self._traer_de_a_una, params, 2)
+
+        paginas = range(2, math.ceil(int(total) / TN_PER_PAGE) + 1)
+        for lote, _ in await asyncio.gather(*(self.transporte.en_pool(self._traer_pagina, params, n) for n in paginas)):
+            pedidos.extend(lote)
+        return pedidos
+
+    def _fusionar(self, cambios):
+        self.almacen.guardar(cambios)
+        cursor = self.cursor
+        for p in cambios:
+            actualizado = p.updated_at
+            if actualizado and (cursor is None or actualizado > cursor): cursor = actualizado
+        if cursor: self.almacen.guardar_meta('cursor_pedidos', cursor)
+
+    async def sincronizar_async(self):
+        """
+        Trae lo que cambió y lo guarda en el almacén. Devuelve cuántos pedidos llegaron.
+        Las páginas (y los estados de la carga completa) se piden a la vez. El delta se pide con
+        status=any para enterarnos también de los pedidos que pasan a cancelados.
+        Si falla la red, lanza la excepción y deja intacto lo que ya había.
+        """
+        async with self._lock:
+            cursor = self.cursor
+            with METRICAS.medir("etapa", etapa="sincronizar", modo="completa" if cursor is None else "delta"):
+                if cursor is None:
+                    lotes = await asyncio.gather(*(self.traer_todos_async({'status': e}) for e in self.estados))
+                    cambios = [p for lote in lotes for p in lote]
+                else:
+                    cambios = await self.traer_todos_async({'status': 'any', 'updated_at_min': cursor})
+                await asyncio.to_thread(self._fusionar, cambios)
+            METRICAS.contar("pedidos_sincronizados", len(cambios))
+            return len(cambios)
+
+
+def nota_con_etiqueta(nota_actual, etiqueta_poner, etiqueta_sacar=None):
+    nota_str = str(nota_actual) if nota_actual is not None else ""
+    if etiqueta_sacar: nota_str = nota_str.replace(etiqueta_sacar, "")
+    if etiqueta_poner and etiqueta_poner not in nota_str: nota_str = f"{nota_str} {etiqueta_poner}"
+    return nota_str.strip()
+
+
+class EscritorPedidos:
+    """
+    Acciones sobre pedidos (`Pedido`). Cada una devuelve (ok, detalle) y es idempotente: si el pedido ya
+    está como debe quedar, no se toca. Las acciones en lote corren en paralelo; el transporte
+    reintenta los 429 y reparte el cupo de la API. Con `almacen`, el pedido que devuelve Tiendanube
+    después de cada escritura queda guardado: la app lo ve en su bandeja nueva sin esperar al webhook.
+    """
+
+    def __init__(self, transporte, hilos=4, almacen=None):
+        self.transporte = transporte
+        self.hilos = hilos
+        self.almacen = almacen
+
+    def _pedir(self, metodo, ruta, payload):
+        res = self.transporte.request(metodo, f"/orders/{ruta}", json=payload)
+        if res.status_code == 200: self._guardar_respuesta(res)
+        return res
+
+    def _guardar_respuesta(self, res):
+        """El pedido (`Pedido`) que devolvió Tiendanube, ya guardado en el almacén; None si la respuesta no lo trae."""
+        try: datos = res.json()
+        except ValueError: return None
+        if not isinstance(datos, dict) or 'id' not in datos: return None
+        pedido = Pedido.desde_tn(datos)
+        if self.almacen is not None: self.almacen.guardar([pedido])
+        return pedido
+
+    def aprobar(self, pedido, etiqueta_poner, etiqueta_sacar=None):
+        nota_final = nota_con_etiqueta(pedido.owner_note, etiqueta_poner, etiqueta_sacar)
+        if pedido.payment_status == 'paid' and nota_final == pedido.owner_note.strip():
+            return True, "Ya estaba aprobado"
+        try:
+            res = self._pedir("PUT", pedido.id, {"payment_status": "paid", "owner_note": nota_final})
+            if res.status_code == 200: return True, "Aprobado"
+            if res.status_code == 422:
+                # TN no deja marcar como pagado (p. ej. medio de pago externo): al menos dejamos la etiqueta
+                res_nota = self._pedir("PUT", pedido.id, {"owner_note": nota_final})
+                if res_nota.status_code == 200: return True, "Etiquetado (TN no permitió marcar pagado)"
+                return False, f"Error Tiendanube: {res_nota.status_code} - {res_nota.text}"
+            return False, f"Error Tiendanube: {res.status_code} - {res.text}"
+        except Exception as e:
+            return False, f"Error de conexión: {e}"
+
+    def etiquetar(self, pedido, etiqueta_poner, etiqueta_sacar=None):
+        nota_final = nota_con_etiqueta(pedido.owner_note, etiqueta_poner, etiqueta_sacar)
+        if nota_final == pedido.owner_note.strip(): return True, "Sin cambios"
+        try:
+            res = self._pedir("PUT", pedido.id, {"owner_note": nota_final})
+            if res.status_code == 200: return True, "Etiquetado"
+            return False, f"Error Tiendanube: {res.status_code} - {res.text}"
+        except Exception as e:
+            return False, f"Error de conexión: {e}"
+
+    def cancelar(self, pedido):
+        if pedido.status == 'cancelled': return True, "Ya estaba cancelado"
+        try:
+            res = self._pedir("POST", f"{pedido.id}/cancel", {"reason": "other"})
+            if res.status_code == 200: return True, "Cancelado"
+            return False, f"Error Tiendanube: {res.status_code} - {res.text}"
+        except Exception as e:
+            return False, f"Error de conexión: {e}"
+
+    def en_lote(self, accion, pedidos, *args):
+        """Aplica `accion` ("aprobar", "etiquetar", "cancelar") a muchos pedidos; genera (id, ok, detalle) a medida que terminan."""
+        funcion = getattr(self, accion)
+        with ThreadPoolExecutor(max_workers=self.hilos) as ex:
+            # Cada acción con los contextvars de quien pidió el lote (la corrida de métricas del rerun)
+            futuros = {ex.submit(contextvars.copy_context().run, funcion, p, *args): p.id for p in pedidos}
+            for fut in as_completed(futuros):
+                ok, detalle = fut.result()
+                yield futuros[fut], ok, detalle
@@ -0,0 +1,226 @@
+"""
+Transporte HTTP compartido, uno por upstream (Tiendanube, ARIA).
+
+Cada transporte tiene su sesión con keep-alive (no más handshake TCP+TLS por
+llamada), timeouts por endpoint, reintentos con backoff y jitter para los GET,
+un token bucket que se ajusta con los headers de rate limit del upstream y un
+disyuntor que corta rápido cuando el upstream está caído, para que un servicio
+lento no congele toda la página.
+Cada intento queda registrado en las métricas (upstream, endpoint, método, status).
+
+Las corrutinas usan el mismo transporte con `en_pool`/`request_async`: la llamada
+bloqueante corre en el pool de hilos propio del transporte y el event loop queda
+libre, con el mismo cupo, reintentos y disyuntor que el código sincrónico.
+"""
+import asyncio
+import contextvars
+import functools
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import METRICAS
+
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS"}
+
+
+class CircuitoAbierto(Exception):
+    """El upstream falló demasiadas veces seguidas; no se intenta hasta que pase la pausa."""
+
+
+class CuboTokens:
+    """
+    Token bucket para no pasarnos del cupo de un upstream. Se ajusta con los headers de rate limit
+    de cada respuesta (x-rate-limit-* de Tiendanube o los X-RateLimit-* habituales).
+    """
+
+    def __init__(self, capacidad=40, ritmo=2.0):
+        self.capacidad = capacidad
+        self.ritmo = ritmo
+        self.tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def _reponer(self, ahora):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultimo) * self.ritmo)
+        self._ultimo = ahora
+
+    def tomar(self):
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._reponer(ahora)
+                if ahora >= self._pausa_hasta and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = max(self._pausa_hasta - ahora, (1 - self.tokens) / self.ritmo)
+            time.sleep(espera)
+
+    def actualizar(self, headers):
+        limite = headers.get('x-rate-limit-limit') or headers.get('x-ratelimit-limit')
+        restantes = headers.get('x-rate-limit-remaining') or headers.get('x-ratelimit-remaining')
+        try: limite, restantes = int(limite), int(restantes)
+        except (TypeError, ValueError): return
+        with self._lock:
+            self._reponer(time.monotonic())
+            self.capacidad = limite
+            self.tokens = min(self.tokens, restantes)
+
+    def pausar(self, segundos):
+        with self._lock:
+            self.tokens = 0
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+
+
+class Disyuntor:
+    """Circuit breaker: tras `umbral` fallos seguidos se abre por `pausa` segundos y después deja pasar una prueba."""
+
+    def __init__(self, umbral=5, pausa=30):
+        self.umbral = umbral
+        self.pausa = pausa
+        self.fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+        self._lock = threading.Lock()
+
+    @property
+    def abierto(self):
+        return self.fallos >= self.umbral and time.monotonic() < self._abierto_hasta
+
+    def permitir(self):
+        with self._lock:
+            if self.fallos < self.umbral: return True
+            if time.monotonic() < self._abierto_hasta or self._probando: return False
+            self._probando = True  # Medio abierto: pasa una sola llamada de prueba
+            return True
+
+    def registrar(self, exito):
+        with self._lock:
+            self._probando = False
+            if exito:
+                self.fallos = 0
+                return
+            self.fallos += 1
+            if self.fallos >= self.umbral: self._abierto_hasta = time.monotonic() + self.pausa
+
+
+def segundos_para_reintentar(res, intento):
+    """Lo que pide un 429 (Retry-After o x-rate-limit-reset en ms); si no dice nada, backoff exponencial."""
+    if res is not None and res.headers.get('Retry-After'):
+        try: return float(res.headers['Retry-After'])
+        except ValueError: pass
+    if res is not None and res.headers.get('x-rate-limit-reset'):
+        try: return int(res.headers['x-rate-limit-reset']) / 1000
+        except ValueError: pass
+    return backoff(intento)
+
+
+def backoff(intento, base=0.5, tope=30):
+    return min(tope, base * 2 ** intento) * random.uniform(0.5, 1.5)
+
+
+def endpoint_de(ruta):
+    """La ruta sin los ids, para que /orders/123 y /orders/456 sean la misma serie."""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", ruta.split("?")[0])
+
+
+class Transporte:
+    def __init__(self, url_base, headers, pool=8, max_concurrentes=None, timeouts=None, timeout_defecto=(5, 15),
+                 reintentos=3, limitador=None, disyuntor=None, nombre="http"):
+        self.url_base = url_base.rstrip("/")
+        self.nombre = nombre  # Etiqueta 'upstream' en las métricas
+        self.sesion = requests.Session()
+        self.sesion.headers.update(headers)
+        self.sesion.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+        self.sesion.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+        self.timeouts = timeouts or {}  # prefijo de ruta -> timeout; gana el prefijo más largo
+        self.timeout_defecto = timeout_defecto
+        self.reintentos = reintentos
+        self.limitador = limitador
+        self.disyuntor = disyuntor
+        self._cupo = threading.BoundedSemaphore(max_concurrentes or pool)
+        # El tope real de conexiones es el cupo; el pool es más grande para que lo que espera
+        # un cache o una consulta compartida no le quite lugar a lo que va a la red
+        self._hilos = 4 * (max_concurrentes or pool)
+        self._ejecutor = None
+        self._lock_ejecutor = threading.Lock()
+
+    def timeout_para(self, ruta):
+        prefijos = [p for p in self.timeouts if ruta.startswith(p)]
+        return self.timeouts[max(prefijos, key=len)] if prefijos else self.timeout_defecto
+
+    def request(self, metodo, ruta, params=None, json=None, timeout=None, stream=False):
+        """
+        Hace la llamada con reintentos. Los GET se reintentan ante errores de red y 5xx; cualquier
+        método se reintenta ante un 429, que el upstream no llegó a procesar.
+        Lanza CircuitoAbierto sin salir a la red si el disyuntor está abierto.
+        Con `stream` el cuerpo se lee después (y la medición cubre sólo hasta los headers).
+        """
+        metodo = metodo.upper()
+        idempotente = metodo in METODOS_IDEMPOTENTES
+        timeout = timeout or self.timeout_para(ruta)
+        etiquetas = {'upstream': self.nombre, 'endpoint': endpoint_de(ruta), 'metodo': metodo}
+        for intento in range(self.reintentos + 1):
+            if intento: METRICAS.contar("http_reintentos", **etiquetas)
+            if self.disyuntor is not None and not self.disyuntor.permitir():
+                METRICAS.contar("http_rechazadas", motivo="circuito_abierto", **etiquetas)
+                raise CircuitoAbierto(self.url_base)
+            if self.limitador is not None:
+                with METRICAS.medir("http_espera_cupo", **etiquetas): self.limitador.tomar()
+            ultimo = intento == self.reintentos
+            try:
+                with self._cupo, METRICAS.medir("http", **etiquetas) as medicion:
+                    res = self.sesion.request(metodo, f"{self.url_base}{ruta}", params=params, json=json, timeout=timeout, stream=stream)
+                    medicion['status'] = str(res.status_code)
+            except (requests.ConnectionError, requests.Timeout):
+                if self.disyuntor is not None: self.disyuntor.registrar(False)
+                if not idempotente or ultimo: raise
+                time.sleep(backoff(intento))
+                continue
+            except Exception:
+                # Cualquier otra falla (p. ej. ChunkedEncodingError) también cuenta: si era la llamada de
+                # prueba del disyuntor medio abierto, sin esto quedaría "probando" para siempre
+                if self.disyuntor is not None: self.disyuntor.registrar(False)
+                raise
+            if self.limitador is not None: self.limitador.actualizar(res.headers)
+            if self.disyuntor is not None: self.disyuntor.registrar(res.status_code < 500)
+            if res.status_code == 429 and not ultimo:
+                espera = segundos_para_reintentar(res, intento)
+                res.close()
+                if self.limitador is not None: self.limitador.pausar(espera)
+                else: time.sleep(espera)
+                continue
+            if res.status_code >= 500 and idempotente and not ultimo:
+                res.close()
+                time.sleep(backoff(intento))
+                continue
+            return res
+        return res
+
+    async def en_pool(self, funcion, *args, **kw):
+        """Corre `funcion` (algo que hace llamadas por este transporte) en su pool de hilos, sin bloquear el event loop."""
+        if self._ejecutor is None:
+            with self._lock_ejecutor:
+                if self._ejecutor is None:
+                    self._ejecutor = ThreadPoolExecutor(max_workers=self._hilos, thread_name_prefix=f"io-{self.nombre}")
+        # Como asyncio.to_thread: el hilo del pool corre con los contextvars de la tarea (la corrida de métricas)
+        contexto = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._ejecutor, functools.partial(contexto.run, funcion, *args, **kw))
+
+    async def request_async(self, metodo, ruta, **kw):
+        return await self.en_pool(self.request, metodo, ruta, **kw)
+
+    def get(self, ruta, params=None, **kw):
+        return self.request("GET", ruta, params=params, **kw)
+
+    def put(self, ruta, json=None, **kw):
+        return self.request("PUT", ruta, json=json, **kw)
+
+    def post(self, ruta, json=None, **kw):
+        return self.request("POST", ruta, json=json, **kw)
@@ -0,0 +1,188 @@
+"""
+Receptor de webhooks de Tiendanube.
+
+Servicio aparte de la app de Streamlit: recibe order/created, order/updated,
+order/paid y order/cancelled, verifica la firma HMAC, trae el pedido y lo guarda
+en el almacén local. La app sólo lee ese almacén. Cada tanto corre una
+sincronización incremental de reconciliación por si se perdió algún evento.
+
+    python webhooks.py servir --puerto 8080
+    python webhooks.py registrar --url https://mi-servidor/webhooks/tiendanube
+    python webhooks.py reproducir grabados.jsonl --url http://localhost:8080/webhooks/tiendanube
+
+La configuración sale de .streamlit/secrets.toml (TN_TOKEN, TN_ID, TN_APP_SECRET,
+DB_PATH) o de variables de entorno con el mismo nombre (motor.leer_config).
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from almacen import Pedido
+from motor import Motor, leer_config
+from tiendanube import TN_CAMPOS_PEDIDO
+
+EVENTOS = ("order/created", "order/updated", "order/paid", "order/cancelled")
+HEADER_FIRMA = "x-linkedstore-hmac-sha256"
+RUTA_WEBHOOK = "/webhooks/tiendanube"
+
+
+def firmar(secreto, cuerpo):
+    return hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+
+def firma_valida(secreto, cuerpo, firma):
+    return bool(firma) and hmac.compare_digest(firmar(secreto, cuerpo), firma)
+
+
+class ProcesadorEventos:
+    """
+    Cola de eventos con un hilo que los aplica al almacén. Tiendanube sólo manda el id del pedido,
+    así que se lo pide a la API; un evento grabado que ya trae el pedido completo ("order") se aplica tal cual.
+    """
+
+    def __init__(self, transporte, almacen, reintentos=3):
+        self.transporte = transporte
+        self.almacen = almacen
+        self.reintentos = reintentos
+        self.cola = queue.Queue()
+        self.aplicados = self.fallidos = 0
+        self._hilo = None
+
+    def encolar(self, evento):
+        self.cola.put((evento, 0))
+
+    def aplicar(self, evento):
+        pedido = evento.get('order')
+        if pedido is None:
+            res = self.transporte.get(f"/orders/{evento['id']}", params={'fields': TN_CAMPOS_PEDIDO})
+            res.raise_for_status()
+            pedido = res.json()
+        self.almacen.guardar([Pedido.desde_tn(pedido)])
+
+    def _bucle(self):
+        while True:
+            evento, intentos = self.cola.get()
+            try:
+                self.aplicar(evento)
+                self.aplicados += 1
+            except Exception as e:
+                if intentos + 1 < self.reintentos:
+                    time.sleep(2 ** intentos)
+                    self.cola.put((evento, intentos + 1))
+                else:
+                    # Lo levanta la próxima reconciliación
+                    self.fallidos += 1
+                    print(f"Evento descartado {evento.get('event')} #{evento.get('id')}: {e}", file=sys.stderr)
+            finally:
+                self.cola.task_done()
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="eventos-tn", daemon=True)
+            self._hilo.start()
+
+
+def crear_servidor(host, puerto, secreto, procesador):
+    class Manejador(BaseHTTPRequestHandler):
+        def _responder(self, codigo, cuerpo=b""):
+            self.send_response(codigo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_POST(self):
+            if self.path != RUTA_WEBHOOK: return self._responder(404)
+            cuerpo = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not firma_valida(secreto, cuerpo, self.headers.get(HEADER_FIRMA)): return self._responder(401)
+            try: evento = json.loads(cuerpo)
+            except ValueError: return self._responder(400)
+            if evento.get('event') not in EVENTOS or 'id' not in evento: return self._responder(202)
+            # Respondemos enseguida; TN reintenta si tardamos
+            procesador.encolar(evento)
+            self._responder(200)
+
+        def do_GET(self):
+            if self.path != "/salud": return self._responder(404)
+            estado = {'pendientes': procesador.cola.qsize(), 'aplicados': procesador.aplicados, 'fallidos': procesador.fallidos}
+            self._responder(200, json.dumps(estado).encode())
+
+        def log_message(self, formato, *args):
+            pass
+
+    return ThreadingHTTPServer((host, puerto), Manejador)
+
+
+def reconciliar_periodicamente(motor, cada):
+    def bucle():
+        while True:
+            try: motor.sincronizar()
+            except Exception as e: print(f"Error en la reconciliación: {e}", file=sys.stderr)
+            time.sleep(cada)
+    threading.Thread(target=bucle, name="reconciliacion-tn", daemon=True).start()
+
+
+def servir(args, config):
+    motor = Motor(config)
+    procesador = ProcesadorEventos(motor.transporte_tn, motor.almacen)
+    procesador.iniciar()
+    if args.reconciliar > 0: reconciliar_periodicamente(motor, args.reconciliar)
+    servidor = crear_servidor(args.host, args.puerto, config["TN_APP_SECRET"], procesador)
+    print(f"Escuchando en http://{args.host}:{servidor.server_port}{RUTA_WEBHOOK}")
+    servidor.serve_forever()
+
+
+def registrar(args, config):
+    """Da de alta en la tienda los webhooks de pedidos apuntando a `--url`."""
+    transporte = Motor(config).transporte_tn
+    for evento in EVENTOS:
+        res = transporte.post("/webhooks", json={"event": evento, "url": args.url})
+        print(f"{evento}: {res.status_code}")
+
+
+def reproducir(args, config):
+    """
+    Reenvía eventos grabados (uno por línea, JSON) a un receptor, firmados con el secreto de la app.
+    Cada línea es el cuerpo del webhook, o {"body": ...} si se grabó con headers.
+    """
+    secreto = config["TN_APP_SECRET"]
+    with open(args.archivo, encoding="utf-8") as f:
+        for linea in f:
+            if not linea.strip(): continue
+            dato = json.loads(linea)
+            cuerpo = json.dumps(dato.get('body', dato)).encode()
+            req = urllib.request.Request(args.url, data=cuerpo, method="POST",
+                                         headers={"Content-Type": "application/json", HEADER_FIRMA: firmar(secreto, cuerpo)})
+            try:
+                with urllib.request.urlopen(req, timeout=10) as res: estado = res.status
+            except urllib.error.HTTPError as e:
+                estado = e.code
+            print(json.dumps({'event': dato.get('body', dato).get('event'), 'id': dato.get('body', dato).get('id'), 'status': estado}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receptor de webhooks de Tiendanube")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("servir")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--puerto", type=int, default=8080)
+    p.add_argument("--reconciliar", type=int, default=900, help="segundos entre sincronizaciones de reconciliación (0 = nunca)")
+    p = sub.add_parser("registrar")
+    p.add_argument("--url", required=True)
+    p = sub.add_parser("reproducir")
+    p.add_argument("archivo")
+    p.add_argument("--url", default=f"http://localhost:8080{RUTA_WEBHOOK}")
+    args = parser.parse_args(argv)
+    config = leer_config()
+    {"servir": servir, "registrar": registrar, "reproducir": reproducir}[args.comando](args, config)
+
+
+if __name__ == "__main__":
+    main()